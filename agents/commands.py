@@ -1,18 +1,25 @@
-from datetime import datetime, timedelta
-import time
+from datetime import datetime
 import click
 import os
+from typing import TYPE_CHECKING
 
-from database.database import Database
-from services.youtube_api_service import YouTubeAPIService
-from services.yt_dlp_service import YTDLPService
+from services.content_store import ContentStore, link_file
+from services.quota_ledger import next_quota_reset
+from services.transcoding import children_cpu_seconds
 from config import load_config
 
+# The services are passed in by the caller; importing them here would make every command
+# pay for the API client and yt-dlp imports
+if TYPE_CHECKING:
+    from database.database import Database
+    from services.youtube_api_service import YouTubeAPIService
+    from services.yt_dlp_service import YTDLPService
+
 class StashVideoTool:
     name = "StashVideoTool"
     description = "This tool stashes a video or its audio from a given URL."
 
-    def __init__(self, yt_dlp_service: YTDLPService):
+    def __init__(self, yt_dlp_service: 'YTDLPService'):
         self.yt_dlp_service = yt_dlp_service
         self.config = load_config()
 
@@ -36,7 +43,7 @@ class UpdatePlaylistTool:
     name = "UpdatePlaylistTool"
     description = "This tool updates a playlist associated with the user's account. It updates metadata and video items as needed."
 
-    def __init__(self, db: Database, youtube_api: YouTubeAPIService):
+    def __init__(self, db: 'Database', youtube_api: 'YouTubeAPIService'):
         self.db = db
         self.youtube_api = youtube_api
 
@@ -72,7 +79,7 @@ class UpdateAllPlaylistsTool:
     name = "UpdateAllPlaylistsTool"
     description = "This tool updates all playlists associated with the user's account. It updates the metadata and video items as needed."
 
-    def __init__(self, db: Database, youtube_api: YouTubeAPIService):
+    def __init__(self, db: 'Database', youtube_api: 'YouTubeAPIService'):
         self.db = db
         self.youtube_api = youtube_api
     
@@ -86,20 +93,25 @@ class UpdateAllPlaylistsTool:
         all_playlists = self.youtube_api.get_playlists()
         total_playlists = len(all_playlists)
 
+        updated_playlists = self.youtube_api.update_playlists(self.db, [playlist['id'] for playlist in all_playlists], all_playlists)
+
+        playlist_ids = [playlist['id'] for playlist in all_playlists]
+        for playlist_id in playlist_ids:
+            if playlist_id in updated_playlists:
+                result["playlists_updated"] += 1
+                click.echo(f"Playlist {playlist_id} metadata has been updated.")
+            else:
+                click.echo(f"No changes detected in playlist {playlist_id} metadata.")
+
         with click.progressbar(length=total_playlists, label='Updating Playlists') as bar:
-            for playlist in all_playlists:
-                playlist_id = playlist['id']
-                playlist_updated = self.youtube_api.update_playlist(self.db, playlist_id)
-                
-                if playlist_updated:
-                    result["playlists_updated"] += 1
-                    message = f"Playlist {playlist_id} metadata has been updated."
-                else:
-                    message = f"No changes detected in playlist {playlist_id} metadata."
-                
-                click.echo(message)  # Print the message in real-time
+            for sync_result in self.youtube_api.sync_playlists(self.db, playlist_ids):
+                playlist_id = sync_result['playlist_id']
+                if 'error' in sync_result:
+                    click.echo(f"Failed to update videos in playlist {playlist_id}: {sync_result['error']}")
+                    bar.update(1)
+                    continue
 
-                updated_videos = self.youtube_api.update_playlist_items(self.db, playlist_id)
+                updated_videos = sync_result['updated']
                 if updated_videos:
                     result["videos_updated"] += len(updated_videos)
                     video_message = f"Updated {len(updated_videos)} videos in playlist {playlist_id}:"
@@ -111,7 +123,7 @@ class UpdateAllPlaylistsTool:
                     no_video_message = f"No changes detected in videos for playlist {playlist_id}."
                     click.echo(no_video_message)  # Print no video changes message
 
-                bar.update(1)  # Update the progress bar
+                bar.update(1)  # Update the progress bar as each playlist finishes
 
         result["message"].append(f"Total playlists updated: {result['playlists_updated']}")
         result["message"].append(f"Total videos updated: {result['videos_updated']}")
@@ -119,18 +131,31 @@ class UpdateAllPlaylistsTool:
         return result
 
 
-def update_playlist_command(obj, playlist_id):
+def update_playlist_command(obj, playlist_id, incremental=None):
     """Function to update a single playlist"""
     db = obj['db']
     youtube_api = obj['youtube_api']
     
     playlist_updated = youtube_api.update_playlist(db, playlist_id)
+    echo_playlist_metadata_result(playlist_id, playlist_updated)
+
+    sync_result = youtube_api.sync_playlist_items(db, playlist_id, incremental)
+    db.update_playlist_last_fetched(playlist_id)
+    echo_playlist_sync_result(sync_result)
+
+def echo_playlist_metadata_result(playlist_id, playlist_updated):
     if playlist_updated:
         click.secho(f"Playlist {playlist_id} metadata has been updated.", fg='green')
     else:
         click.secho(f"No changes detected in playlist {playlist_id} metadata.", fg='yellow')
 
-    updated_videos = youtube_api.update_playlist_items(db, playlist_id)
+def echo_playlist_sync_result(sync_result):
+    playlist_id = sync_result['playlist_id']
+    if 'error' in sync_result:
+        click.secho(f"Failed to update videos in playlist {playlist_id}: {sync_result['error']}", fg='red')
+        return
+
+    updated_videos = sync_result['updated']
     if updated_videos:
         click.secho(f"Updated {len(updated_videos)} videos in playlist {playlist_id}:", fg='green')
         for video_id in updated_videos:
@@ -138,18 +163,64 @@ def update_playlist_command(obj, playlist_id):
     else:
         click.secho(f"No changes detected in videos for playlist {playlist_id}.", fg='yellow')
 
-    db.update_playlist_last_fetched(playlist_id)
+    if sync_result['removed']:
+        click.secho(f"Removed {len(sync_result['removed'])} videos from playlist {playlist_id}:", fg='yellow')
+        for video_id in sync_result['removed']:
+            click.echo(f"  • {click.style(video_id, fg='cyan')}")
+
     click.secho(f"Playlist {playlist_id} update process completed.", fg='green', bold=True)
 
-def update_all_playlists_command(obj):
-    """Function to update all playlists"""
+def update_all_playlists_command(obj, incremental=None, workers=None):
+    """Function to update all playlists, syncing up to `workers` playlists concurrently"""
+    db = obj['db']
     youtube_api = obj['youtube_api']
     playlists = youtube_api.get_playlists()
-    for playlist in playlists:
-        playlist_id = playlist['id']
-        update_playlist_command(obj, playlist_id)
+    playlist_ids = [playlist['id'] for playlist in playlists]
+
+    # The listing already carries each playlist's metadata, so it is stored without further lookups
+    updated_playlists = youtube_api.update_playlists(db, playlist_ids, playlists)
+    for playlist_id in playlist_ids:
+        echo_playlist_metadata_result(playlist_id, playlist_id in updated_playlists)
+
+    for sync_result in youtube_api.sync_playlists(db, playlist_ids, workers, incremental):
+        echo_playlist_sync_result(sync_result)
     click.secho(f"All playlists for your account updated successfully.", fg='green')
 
+    if youtube_api.response_cache:
+        stats = youtube_api.response_cache.stats()
+        click.echo(f"API cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries ({stats['bytes'] / 1024:.0f} KB)")
+    stats = youtube_api.transport.stats()
+    click.echo(f"API requests: {stats['requests']} over {stats['connections_opened']} connections, "
+               f"{stats['p50_ms']:.0f} ms median, {stats['p95_ms']:.0f} ms p95 latency")
+
+def quota_status_command(obj):
+    """Function to show today's API quota usage per command"""
+    quota_ledger = obj['quota_ledger']
+    if not quota_ledger:
+        click.secho("No quota ledger configured. Set quota_ledger_path in controls.toml.", fg='yellow')
+        return
+
+    used = quota_ledger.used()
+    click.echo(f"Quota used today: {click.style(f'{used}/{quota_ledger.daily_limit}', fg='green')} units")
+    for row in quota_ledger.usage_by_command():
+        click.echo(f"  {row['command']}: {row['units']} units over {row['calls']} calls")
+    click.echo(f"Quota resets at {next_quota_reset():%Y-%m-%d %H:%M %Z}")
+
+def refresh_discovery_command(obj):
+    """Function to download the current YouTube API discovery document for offline client builds"""
+    from services.youtube_discovery import DiscoveryError, refresh_discovery_document
+
+    path = obj['config'].get('discovery_document_path')
+    if not path:
+        click.secho("No discovery document path configured. Set discovery_document_path in controls.toml.", fg='yellow')
+        return
+    try:
+        refreshed = refresh_discovery_document(path)
+    except (DiscoveryError, OSError) as e:
+        click.secho(f"Could not refresh the discovery document: {e}", fg='red', err=True)
+        return
+    click.secho(f"Saved discovery document revision {refreshed['revision']} to {path} ({refreshed['bytes'] / 1024:.0f} KiB).", fg='green')
+
 def stash_video_command(obj, video_url, output_path, audio_only):
     """Function to stash a video or its audio"""
     yt_dlp_service = obj['yt_dlp_service']
@@ -190,11 +261,41 @@ def check_playlist_delta_command(obj, verbose, save):
         job_id = db.save_delta_job(delta_data)
         click.echo(f"Delta saved as job ID: {job_id}")
 
-def stash_playlist_command(obj, playlist_id, output_path, audio_only, batch_size, batch_delay, summary_interval):
+def find_stored_downloads(db, content_store, video_ids, output_path):
+    """
+    Returns {video_id: download} for the videos whose last download is held in the content store
+    and is not yet in output_path; download['dest'] is where it is to be linked.
+    """
+    stored_downloads = {}
+    for video_id, download in db.get_latest_downloads(video_ids).items():
+        dest = os.path.join(output_path, os.path.basename(download['file_path']))
+        if os.path.lexists(dest):
+            continue
+        stored = content_store.find(download['file_hash'])
+        if stored:
+            stored_downloads[video_id] = {**download, 'stored_path': stored, 'dest': dest}
+    return stored_downloads
+
+def link_stored_downloads(db, content_store, stored_downloads):
+    """
+    Links stored downloads into place instead of downloading them again, recording each link
+    created as a download. Returns the number of links created.
+    """
+    new_downloads = []
+    for video_id, download in stored_downloads.items():
+        if content_store.link(download['stored_path'], download['dest']) != 'existing':
+            new_downloads.append((video_id, download['dest'], download['file_hash'], download['file_blake2b']))
+    db.add_downloads(new_downloads)
+    return len(new_downloads)
+
+def stash_playlist_command(obj, playlist_id, output_path, audio_only, batch_size, batch_delay, summary_interval, workers=None, downloads_per_hour=None, content_store=None, audio_mode=None, plan_only=False, adaptive=None):
     """Function to stash all videos in a playlist"""
     db = obj['db']
     youtube_api = obj['youtube_api']
     yt_dlp_service = obj['yt_dlp_service']
+    if plan_only and not check_can_plan(yt_dlp_service):
+        return
+    store = yt_dlp_service.create_content_store(output_path, content_store)
 
     # Get playlist details
     playlist_details = youtube_api.get_playlist_details(playlist_id)
@@ -213,14 +314,15 @@ def stash_playlist_command(obj, playlist_id, output_path, audio_only, batch_size
 
     audio_only = click.confirm(click.style("Do you want to stash audio only?", fg='cyan'), default=False)
 
-    # Get all video details and update in database
-    videos = youtube_api.get_all_playlist_video_details(db, playlist_id)
+    # Sync the playlist once and reuse the fetched video details
+    sync_result = youtube_api.get_all_playlist_video_details(db, playlist_id, playlist_details)
+    videos = sync_result['videos']
 
-    # Filter out already stashed videos
+    # Filter out already stashed videos, fetching the download state of the whole playlist at once
+    download_states = db.get_download_states(video['id'] for video in videos)
     videos_to_download = []
     for video in videos:
-        downloaded, file_hash = db.get_video_download_status(video['id'])
-        if not downloaded:
+        if not download_states[video['id']]['downloaded']:
             videos_to_download.append(video)
         else:
             click.secho(f"Video {video['id']} already stashed. Skipping.", fg='yellow')
@@ -229,84 +331,449 @@ def stash_playlist_command(obj, playlist_id, output_path, audio_only, batch_size
         click.secho("All videos in this playlist have already been stashed.", fg='green')
         return
 
+    # Skip videos that already have a download recorded, and duplicates within the playlist;
+    # with a content store, previously downloaded videos are linked in from the store instead
+    pending_ids = []
+    stored_ids = []
+    skipped_videos = 0
+    for video in videos_to_download:
+        if download_states[video['id']]['download_count']:
+            stored_ids.append(video['id'])
+        elif video['id'] not in pending_ids:
+            pending_ids.append(video['id'])
+
+    stored_downloads = find_stored_downloads(db, store, stored_ids, output_path) if store else {}
+    for video_id in dict.fromkeys(stored_ids):
+        if video_id in stored_downloads:
+            click.secho(f"Video {video_id} is in the content store and will be linked", fg='green')
+        else:
+            click.secho(f"Video {video_id} already exists in the database", fg='yellow')
+            skipped_videos += 1
+
+    if not pending_ids and not stored_downloads:
+        click.secho("All videos in this playlist have already been stashed.", fg='green')
+        return
+
+    # Pace downloads at a steady rate; without an explicit rate, spread each
+    # batch_size downloads over batch_delay seconds as the batches used to
+    throttle_state = starting_throttle_state(db, workers, downloads_per_hour)
+    downloads_per_hour = downloads_per_hour or yt_dlp_service.downloads_per_hour
+    if not downloads_per_hour and batch_delay > 0:
+        downloads_per_hour = batch_size * 3600 / batch_delay
+    scheduler = yt_dlp_service.create_scheduler(
+        workers=workers, downloads_per_hour=downloads_per_hour, burst=batch_size,
+        adaptive=adaptive, throttle_state=throttle_state
+    )
+    pacing = describe_pacing(scheduler, batch_size)
+
     # Prepare summary
     click.echo("\n" + "=" * 50)
     click.secho("Stash Summary", fg='cyan', bold=True)
     click.echo("=" * 50)
     click.echo(f"Playlist: {click.style(playlist_details['title'], fg='green')}")
-    click.echo(f"Number of videos to stash: {click.style(str(len(videos_to_download)), fg='green')}")
+    click.echo(f"Number of videos to stash: {click.style(str(len(pending_ids)), fg='green')}")
     click.echo(f"Output path: {click.style(output_path, fg='green')}")
     click.echo(f"Audio only: {click.style('Yes' if audio_only else 'No', fg='green')}")
-    click.echo(f"Batch size: {click.style(str(batch_size), fg='green')}")
-    click.echo(f"Delay between batches: {click.style(f'{batch_delay} seconds ({batch_delay / 60:.1f} minutes)', fg='green')}")
+    if audio_only:
+        click.echo(f"Audio mode: {click.style(audio_mode or yt_dlp_service.audio_mode, fg='green')}")
+    click.echo(f"Content store: {click.style(store.root if store else 'No', fg='green')} ({len(stored_downloads)} videos to link)")
+    click.echo(f"Download workers: {click.style(str(scheduler.workers), fg='green')}")
+    click.echo(f"Pacing: {click.style(pacing, fg='green')}")
     click.echo(f"Summary interval: {click.style(f'{summary_interval} seconds ({summary_interval / 60:.1f} minutes)', fg='green')}")
     click.echo("=" * 50 + "\n")
 
-    # Ask for user consent
-    if not click.confirm(click.style("Do you want to proceed with the stashing?", fg='cyan', bold=True)):
+    # Ask for user consent; planning only resolves the queue, without downloading anything
+    if not plan_only and not click.confirm(click.style("Do you want to proceed with the stashing?", fg='cyan', bold=True)):
         click.secho("Stashing cancelled.", fg='yellow')
         return
 
-    # Prepare batches
-    batches = [videos_to_download[i:i + batch_size] for i in range(0, len(videos_to_download), batch_size)]
-    click.secho(f"batches {batches}", fg='red', bold=True)
+    if stored_downloads and not plan_only:
+        linked = link_stored_downloads(db, store, stored_downloads)
+        click.secho(f"Linked {linked} videos from the content store.", fg='green')
+    if not pending_ids:
+        return
 
-    start_time = datetime.now()
-    last_summary_time = start_time
-    total_videos = len(videos_to_download)
-    downloaded_videos = 0
-    skipped_videos = 0
+    # Persist the plan before downloading, so an interrupted run can be resumed with resume-stash
+    job_id = db.create_download_job(
+        playlist_id, output_path, audio_only, pending_ids,
+        downloads_per_hour=downloads_per_hour, burst=batch_size, skipped=skipped_videos,
+        store_path=store.root if store else None,
+        audio_mode=(audio_mode or yt_dlp_service.audio_mode) if audio_only else None
+    )
+    # A job taken over from an interrupted run gets its abandoned and retryable items back
+    db.reset_download_queue(job_id)
+    click.echo(f"Stash job ID: {job_id}")
+    if plan_only:
+        plan_download_job(obj, db.get_download_job(job_id), scheduler)
+        return
+    run_download_job(obj, db.get_download_job(job_id), summary_interval, scheduler)
+
+def starting_throttle_state(db, workers=None, downloads_per_hour=None):
+    """
+    Returns the pacing an adaptive run starts from: the state saved by the last run, with
+    the rate and concurrency given on the command line taking precedence.
+    """
+    state = dict(db.get_throttle_state() or {})
+    if downloads_per_hour:
+        state['downloads_per_hour'] = downloads_per_hour
+    if workers:
+        state['concurrency'] = workers
+    return state
+
+def describe_pacing(scheduler, burst):
+    """Describes how a scheduler paces downloads, for the stash summaries"""
+    if scheduler.throttle:
+        throttle = scheduler.throttle
+        return (f"adaptive, starting at {throttle.downloads_per_hour:.1f} videos/hour "
+                f"with {throttle.concurrency} of {throttle.max_concurrency} workers")
+    if scheduler.downloads_per_hour:
+        return f"{scheduler.downloads_per_hour:.1f} videos/hour (bursts of {burst})"
+    return 'unpaced'
+
+def get_playlist_folders(db, output_path):
+    """Returns {video_id: [folder, ...]}: the folder of every synced playlist each video is in"""
+    titles = {playlist['id']: playlist['title'] for playlist in db.get_all_playlists()}
+    return {
+        video_id: [os.path.join(output_path, titles[playlist_id]) for playlist_id in playlist_ids if playlist_id in titles]
+        for video_id, playlist_ids in db.get_playlist_memberships().items()
+    }
+
+def place_in_folders(file_path, folders):
+    """
+    Moves a downloaded file into the first folder and links it into the others. Returns the new paths.
+    A file already at the first path (e.g. left by a run that crashed before recording it) is
+    replaced by the fresh download.
+    """
+    name = os.path.basename(file_path)
+    paths = [os.path.join(folder, name) for folder in folders]
+    os.makedirs(folders[0], exist_ok=True)
+    os.replace(file_path, paths[0])
+    for path in paths[1:]:
+        link_file(paths[0], path)
+    return paths
+
+def stash_all_playlists_command(obj, output_path, audio_only, batch_size, batch_delay, summary_interval, workers=None, downloads_per_hour=None, content_store=None, audio_mode=None, plan_only=False, adaptive=None):
+    """Function to stash every video of every synced playlist, downloading each video only once"""
+    db = obj['db']
+    yt_dlp_service = obj['yt_dlp_service']
+    if plan_only and not check_can_plan(yt_dlp_service):
+        return
+    store = yt_dlp_service.create_content_store(output_path, content_store)
+
+    # Build one work set from the synced playlist memberships, deduplicated by video
+    playlist_folders = get_playlist_folders(db, output_path)
+    playlist_folders = {video_id: folders for video_id, folders in playlist_folders.items() if folders}
+    if not playlist_folders:
+        click.secho("No synced playlist items found. Run update-all-playlists first.", fg='yellow')
+        return
+
+    download_states = db.get_download_states(playlist_folders)
+    pending_ids = []
+    downloaded_ids = []
+    for video_id in playlist_folders:
+        if download_states[video_id]['download_count']:
+            downloaded_ids.append(video_id)
+        elif not download_states[video_id]['downloaded']:
+            pending_ids.append(video_id)
+    skipped_videos = len(playlist_folders) - len(pending_ids) - len(downloaded_ids)
+
+    # Videos downloaded before are linked into the folders still missing them, from the
+    # content store if it holds them, or else from their last downloaded file
+    links = []
+    for video_id, download in db.get_latest_downloads(downloaded_ids).items():
+        source = store.find(download['file_hash']) if store else None
+        if not source and os.path.exists(download['file_path']):
+            source = download['file_path']
+        if not source:
+            skipped_videos += 1
+            continue
+        for folder in playlist_folders[video_id]:
+            dest = os.path.join(folder, os.path.basename(download['file_path']))
+            if not os.path.lexists(dest):
+                links.append((video_id, source, dest, download))
+
+    if not pending_ids and not links:
+        click.secho("All videos in all playlists have already been stashed.", fg='green')
+        return
+
+    throttle_state = starting_throttle_state(db, workers, downloads_per_hour)
+    downloads_per_hour = downloads_per_hour or yt_dlp_service.downloads_per_hour
+    if not downloads_per_hour and batch_delay > 0:
+        downloads_per_hour = batch_size * 3600 / batch_delay
+    scheduler = yt_dlp_service.create_scheduler(
+        workers=workers, downloads_per_hour=downloads_per_hour, burst=batch_size,
+        adaptive=adaptive, throttle_state=throttle_state
+    )
+    pacing = describe_pacing(scheduler, batch_size)
+    placements = sum(len(playlist_folders[video_id]) for video_id in pending_ids)
+
+    click.echo("\n" + "=" * 50)
+    click.secho("Stash All Summary", fg='cyan', bold=True)
+    click.echo("=" * 50)
+    click.echo(f"Playlists: {click.style(str(len(db.get_all_playlists())), fg='green')}")
+    click.echo(f"Unique videos: {click.style(str(len(playlist_folders)), fg='green')}")
+    click.echo(f"Videos to stash: {click.style(str(len(pending_ids)), fg='green')} (placed into {placements} playlist folders)")
+    click.echo(f"Links to existing files: {click.style(str(len(links)), fg='green')}")
+    click.echo(f"Skipped (already present elsewhere): {click.style(str(skipped_videos), fg='yellow')}")
+    click.echo(f"Output path: {click.style(output_path, fg='green')}")
+    click.echo(f"Audio only: {click.style('Yes' if audio_only else 'No', fg='green')}")
+    if audio_only:
+        click.echo(f"Audio mode: {click.style(audio_mode or yt_dlp_service.audio_mode, fg='green')}")
+    click.echo(f"Content store: {click.style(store.root if store else 'No', fg='green')}")
+    click.echo(f"Download workers: {click.style(str(scheduler.workers), fg='green')}")
+    click.echo(f"Pacing: {click.style(pacing, fg='green')}")
+    click.echo(f"Summary interval: {click.style(f'{summary_interval} seconds ({summary_interval / 60:.1f} minutes)', fg='green')}")
+    click.echo("=" * 50 + "\n")
+
+    if not plan_only and not click.confirm(click.style("Do you want to proceed with the stashing?", fg='cyan', bold=True)):
+        click.secho("Stashing cancelled.", fg='yellow')
+        return
+
+    if links and not plan_only:
+        new_downloads = []
+        for video_id, source, dest, download in links:
+            link_file(source, dest)
+            new_downloads.append((video_id, dest, download['file_hash'], download['file_blake2b']))
+        db.add_downloads(new_downloads)
+        click.secho(f"Linked {len(links)} existing files into playlist folders.", fg='green')
+    if not pending_ids:
+        return
+
+    # A job without a playlist covers every synced playlist; finished downloads are placed
+    # into each playlist folder that contains the video
+    job_id = db.create_download_job(
+        None, output_path, audio_only, pending_ids,
+        downloads_per_hour=downloads_per_hour, burst=batch_size, skipped=skipped_videos,
+        store_path=store.root if store else None,
+        audio_mode=(audio_mode or yt_dlp_service.audio_mode) if audio_only else None
+    )
+    # A job taken over from an interrupted run gets its abandoned and retryable items back
+    db.reset_download_queue(job_id)
+    click.echo(f"Stash job ID: {job_id}")
+    if plan_only:
+        plan_download_job(obj, db.get_download_job(job_id), scheduler)
+        return
+    run_download_job(obj, db.get_download_job(job_id), summary_interval, scheduler)
+
+def resume_stash_command(obj, job_id, summary_interval, workers=None, downloads_per_hour=None, adaptive=None):
+    """Function to resume an interrupted stash job from its persisted download queue"""
+    db = obj['db']
+    yt_dlp_service = obj['yt_dlp_service']
+
+    job = db.get_download_job(job_id) if job_id else db.get_latest_active_download_job()
+    if not job:
+        click.secho(f"Stash job {job_id} not found." if job_id else "No unfinished stash job to resume.", fg='red', err=True)
+        return
+
+    reset = db.reset_download_queue(job['id'])
+    counts = db.get_download_queue_counts(job['id'])
+    if not counts['pending']:
+        db.finish_download_job(job['id'])
+        click.secho(f"Stash job {job['id']} has nothing left to stash.", fg='green')
+        return
+
+    throttle_state = starting_throttle_state(db, workers, downloads_per_hour)
+    downloads_per_hour = downloads_per_hour or job['downloads_per_hour']
+    scheduler = yt_dlp_service.create_scheduler(
+        workers=workers, downloads_per_hour=downloads_per_hour, burst=job['burst'],
+        adaptive=adaptive, throttle_state=throttle_state
+    )
+    pacing = describe_pacing(scheduler, job['burst'])
+
+    click.echo("\n" + "=" * 50)
+    click.secho("Resume Summary", fg='cyan', bold=True)
+    click.echo("=" * 50)
+    click.echo(f"Stash job: {click.style(str(job['id']), fg='green')} (playlist {job['playlist_id'] or 'all playlists'}, created {job['created_at']})")
+    click.echo(f"Already stashed: {click.style(str(counts['done']), fg='green')}")
+    click.echo(f"Failed (out of attempts): {click.style(str(counts['failed']), fg='red')}")
+    click.echo(f"Videos to stash: {click.style(str(counts['pending']), fg='green')} ({reset} requeued from earlier runs)")
+    click.echo(f"Output path: {click.style(job['output_path'], fg='green')}")
+    click.echo(f"Audio only: {click.style('Yes' if job['audio_only'] else 'No', fg='green')}")
+    if job['audio_only']:
+        click.echo(f"Audio mode: {click.style(job['audio_mode'] or yt_dlp_service.audio_mode, fg='green')}")
+    click.echo(f"Content store: {click.style(job['store_path'] or 'No', fg='green')}")
+    click.echo(f"Download workers: {click.style(str(scheduler.workers), fg='green')}")
+    click.echo(f"Pacing: {click.style(pacing, fg='green')}")
+    click.echo("=" * 50 + "\n")
+
+    if not click.confirm(click.style("Do you want to resume the stashing?", fg='cyan', bold=True)):
+        click.secho("Stashing cancelled.", fg='yellow')
+        return
+
+    run_download_job(obj, job, summary_interval, scheduler)
+
+def check_can_plan(yt_dlp_service):
+    """Returns whether stash jobs can be planned, explaining why not; checked before a job is created"""
+    if not yt_dlp_service.info_cache:
+        click.secho("Planning needs the info cache; set info_cache_path in controls.toml.", fg='red', err=True)
+        return False
+    return True
+
+def plan_download_job(obj, job, scheduler):
+    """
+    Resolves the pending items of a stash job in parallel, caching the results for the download run.
+    Only the items the job's pacing starts within the info cache's TTL are resolved; info
+    resolved for later items would expire before their download starts.
+    """
+    db = obj['db']
+    yt_dlp_service = obj['yt_dlp_service']
+    ttl_hours = yt_dlp_service.info_cache.ttl_seconds / 3600
+
+    video_ids = db.get_download_queue_video_ids(job['id'], 'pending')
+    warm = len(video_ids)
+    if scheduler.downloads_per_hour:
+        # The first burst starts at once, then downloads_per_hour until the cache entries expire
+        warm = min(warm, job['burst'] + int(scheduler.downloads_per_hour * ttl_hours))
+    deferred = len(video_ids) - warm
+    click.echo(f"Resolving {warm} videos with {scheduler.workers} workers...")
+    resolved = 0
+    unavailable = []
+    total_bytes = 0
+    throttled = False
+    results = yt_dlp_service.resolve_many(
+        video_ids[:warm], job['output_path'], job['audio_only'], job['audio_mode'], scheduler.workers, throttle=scheduler.throttle
+    )
+    for result in results:
+        if result['throttled']:
+            throttled = True
+            click.secho(f"YouTube is throttling extraction (video {result['video_id']}); stopping.", fg='yellow')
+            continue
+        if result['status'] == 'unavailable':
+            unavailable.append(result)
+            click.secho(f"Video {result['video_id']} cannot be stashed: {result['error']}", fg='red')
+            continue
+        resolved += 1
+        total_bytes += result['filesize'] or 0
+        click.echo(f"Resolved video {result['video_id']}: {result['title']} [{result['format']}]")
+
+    if scheduler.throttle:
+        # A throttling error slows the downloads of this and later runs down too
+        db.save_throttle_state(scheduler.throttle.state())
+    click.echo("\n" + "=" * 50)
+    click.secho("Stash Plan", fg='cyan', bold=True)
+    click.echo("=" * 50)
+    click.echo(f"Resolved: {click.style(str(resolved), fg='green')} (about {total_bytes / 1024 / 1024:.1f} MiB)")
+    click.echo(f"Unavailable: {click.style(str(len(unavailable)), fg='red')}")
+    click.echo(f"Resolved info is cached for {ttl_hours:.1f} hours.")
+    if throttled:
+        click.secho("Resolution stopped at a throttling error; the videos left are resolved when they download.", fg='yellow')
+    if deferred:
+        click.echo(f"Not resolved: {click.style(str(deferred), fg='yellow')} (at {scheduler.downloads_per_hour:.1f} videos/hour they start "
+                   f"after the cache expires, so they are resolved when they download)")
+    click.echo(f"Start the downloads while it is fresh with: python main.py resume-stash --job-id {job['id']}")
+    click.echo("=" * 50 + "\n")
+
+def run_download_job(obj, job, summary_interval, scheduler):
+    """Downloads the pending items of a stash job, claiming each from the queue as a worker frees up"""
+    db = obj['db']
+    yt_dlp_service = obj['yt_dlp_service']
+    job_id = job['id']
+    content_store = ContentStore(job['store_path']) if job['store_path'] else None
+    playlist_folders = get_playlist_folders(db, job['output_path']) if job['playlist_id'] is None else {}
+    last_summary_time = datetime.now()
+    hash_seconds = 0.0
+    cpu_started = children_cpu_seconds()
+
+    def save_throttle_state():
+        # Later runs start from the pacing this one settled on
+        if scheduler.throttle:
+            db.save_throttle_state(scheduler.throttle.state())
 
     def print_summary():
-        nonlocal downloaded_videos, skipped_videos, start_time, last_summary_time
-        elapsed_time = datetime.now() - start_time
-        videos_per_hour = (downloaded_videos + skipped_videos) / (elapsed_time.total_seconds() / 3600) if elapsed_time.total_seconds() > 0 else 0
-        estimated_completion_time = start_time + (elapsed_time / (downloaded_videos + skipped_videos) * total_videos if (downloaded_videos + skipped_videos) > 0 else timedelta(0))
+        nonlocal last_summary_time
+        progress = scheduler.progress()
         last_summary_time = datetime.now()
+        save_throttle_state()
+        eta = progress['eta'].strftime('%Y-%m-%d %H:%M:%S') if progress['eta'] else 'n/a'
         
         click.echo("\n" + "=" * 50)
         click.secho("Stashing Progress", fg='cyan', bold=True)
         click.echo("=" * 50)
-        click.echo(f"Progress: {click.style(f'{downloaded_videos + skipped_videos}/{total_videos}', fg='green')} videos")
-        click.echo(f"Stashed: {click.style(str(downloaded_videos), fg='green')}")
-        click.echo(f"Skipped (already present): {click.style(str(skipped_videos), fg='yellow')}")
-        click.echo(f"Elapsed time: {click.style(str(elapsed_time), fg='cyan')}")
-        click.echo(f"Average speed: {click.style(f'{videos_per_hour:.2f}', fg='cyan')} videos/hour")
-        click.echo(f"Estimated completion time: {click.style(str(estimated_completion_time), fg='cyan')}")
+        finished = f"{progress['completed'] + progress['failed']}/{progress['total']}"
+        click.echo(f"Progress: {click.style(finished, fg='green')} videos")
+        click.echo(f"Stashed: {click.style(str(progress['completed']), fg='green')}")
+        click.echo(f"Failed: {click.style(str(progress['failed']), fg='red')}")
+        click.echo(f"Skipped (already present): {click.style(str(job['skipped']), fg='yellow')}")
+        click.echo(f"Elapsed time: {click.style(str(progress['elapsed']), fg='cyan')}")
+        per_hour = f"{progress['per_hour']:.2f}"
+        click.echo(f"Average speed: {click.style(per_hour, fg='cyan')} videos/hour ({progress['bytes_per_second'] / 1024 / 1024:.2f} MiB/s)")
+        click.echo(f"Hashing time: {click.style(f'{hash_seconds:.1f} seconds', fg='cyan')} (overlapped with downloads)")
+        # Every ffmpeg process of the run, whether yt-dlp or the transcode pool started it
+        cpu_seconds = children_cpu_seconds() - cpu_started
+        click.echo(f"Media processing CPU time: {click.style(f'{cpu_seconds:.1f} seconds', fg='cyan')}")
+        if yt_dlp_service.info_cache:
+            info_stats = yt_dlp_service.info_cache.stats()
+            click.echo(f"Info cache: {info_stats['hits']} hits, {info_stats['misses']} extractions")
+        if progress['throttle']:
+            throttle = progress['throttle']
+            rate = f"{throttle['downloads_per_hour']:.1f} videos/hour"
+            click.echo(f"Adaptive pacing: {click.style(rate, fg='cyan')} "
+                       f"with {throttle['concurrency']} workers ({throttle['throttle_events']} throttling errors, {throttle['cuts']} slowdowns)")
+        click.echo(f"Estimated completion time: {click.style(eta, fg='cyan')}")
         click.echo("=" * 50 + "\n")
 
-    # Download videos in batches
-    with click.progressbar(batches, label='Stashing batches', show_eta=False) as bar:
-        for i, batch in enumerate(bar):
-            click.echo(f"\nProcessing batch {click.style(str(i+1), fg='cyan')} of {click.style(str(len(batches)), fg='cyan')}...")
-            
-            for video in batch:
-                existing_downloads = db.get_downloads_for_video(video['id'])
-                if existing_downloads:
-                    click.secho(f"Video {video['id']} already exists in the database", fg='yellow')
-                    skipped_videos += 1
-                    continue
-                result = yt_dlp_service.download_videos([video['id']], output_path, audio_only, db)
-                if result == 'downloaded':
-                    downloaded_videos += 1
-                    click.secho(f"Successfully stashed video {video['id']}", fg='green')
-
-                elif result == 'file_not_found':
-                    click.secho(f"File not found after stashing for video {video['id']}. This might be due to an issue with file conversion or permissions.", fg='yellow')
-                elif result == 'download_error':
-                    click.secho(f"yt-dlp stashing error for video {video['id']}. The video might be unavailable or restricted.", fg='red')
-                elif result == 'unexpected_error':
-                    click.secho(f"Unexpected error stashing video {video['id']}. Please check the logs for more details.", fg='red')
-
-            if i < len(batches) - 1:  # If it's not the last batch
-                click.echo(f"Waiting for {click.style(str(batch_delay), fg='cyan')} seconds ({batch_delay / 60:.1f} minutes) before the next batch...")
-                
-                # Print summary during longer waits
-                wait_start = datetime.now()
-                while (datetime.now() - wait_start).total_seconds() < batch_delay:
-                    time.sleep(min(summary_interval, batch_delay))
-                    if (datetime.now() - last_summary_time).total_seconds() >= summary_interval:
-                        print_summary()
-
-    click.secho("\nPlaylist stashing completed.", fg='green', bold=True)
-    print_summary()
\ No newline at end of file
+    def maybe_print_summary():
+        if (datetime.now() - last_summary_time).total_seconds() >= summary_interval:
+            print_summary()
+
+    def claimed_video_ids():
+        while True:
+            video_id = db.claim_download_item(job_id)
+            if video_id is None:
+                return
+            yield video_id
+
+    # Download on the worker pool; items are claimed and results recorded here, on the database's thread
+    pending = db.get_download_queue_counts(job_id)['pending']
+    results = yt_dlp_service.download_many(
+        claimed_video_ids(), job['output_path'], job['audio_only'], scheduler,
+        on_tick=maybe_print_summary, total=pending, content_store=content_store, audio_mode=job['audio_mode']
+    )
+    try:
+        for result in results:
+            video_id = result['video_id']
+            status = result['status']
+            progress = scheduler.progress()
+            counter = f"[{progress['completed'] + progress['failed']}/{progress['total']}, {progress['per_hour']:.1f}/h]"
+            if status == 'downloaded':
+                paths = [result['path']]
+                if playlist_folders.get(video_id):
+                    paths = place_in_folders(result['path'], playlist_folders[video_id])
+                db.finish_download_item(
+                    job_id, video_id, 'done',
+                    file_path=paths[0], file_hash=result['file_hash'], file_blake2b=result['file_blake2b'],
+                    cpu_seconds=result['cpu_seconds']
+                )
+                db.add_downloads([(video_id, path, result['file_hash'], result['file_blake2b']) for path in paths[1:]])
+                hash_seconds += result['hash_seconds']
+                size = f"{result['bytes'] / 1024 / 1024:.1f} MiB"
+                timings = f"{size} in {result['elapsed']:.1f}s, hashed in {result['hash_seconds']:.1f}s"
+                if result['transcode_seconds'] is not None:
+                    timings += f", {result['audio_method']} in {result['transcode_seconds']:.1f}s"
+                if result['cpu_seconds']:
+                    timings += f", {result['cpu_seconds']:.1f}s CPU"
+                click.secho(f"{counter} Successfully stashed video {video_id} ({timings})", fg='green')
+                continue
+
+            db.finish_download_item(job_id, video_id, 'failed', error=result['error'], cpu_seconds=result['cpu_seconds'])
+            if status == 'file_not_found':
+                click.secho(f"{counter} File not found after stashing for video {video_id}. This might be due to an issue with file conversion or permissions.", fg='yellow')
+            elif status == 'download_error' and result['throttled']:
+                click.secho(f"{counter} YouTube is throttling downloads (video {video_id}); slowing down.", fg='yellow')
+            elif status == 'download_error':
+                click.secho(f"{counter} yt-dlp stashing error for video {video_id}. The video might be unavailable or restricted.", fg='red')
+            elif status == 'transcode_error':
+                click.secho(f"{counter} Transcoding failed for video {video_id}. Check that ffmpeg is installed and supports the codec.", fg='red')
+            elif status == 'unexpected_error':
+                click.secho(f"{counter} Unexpected error stashing video {video_id}. Please check the logs for more details.", fg='red')
+    except KeyboardInterrupt:
+        results.close()
+        save_throttle_state()
+        click.secho(f"\nStashing interrupted. Resume it with: python main.py resume-stash --job-id {job_id}", fg='yellow', bold=True)
+        return
+
+    if db.finish_download_job(job_id):
+        click.secho("\nPlaylist stashing completed.", fg='green', bold=True)
+    else:
+        click.secho(f"\nSome videos failed and will be retried. Resume with: python main.py resume-stash --job-id {job_id}", fg='yellow', bold=True)
+    print_summary()
@@ -24,13 +24,13 @@ class Stasher:
     @property
     def youtube_api(self):
         if self._youtube_api is None:
-            self._youtube_api = YouTubeAPIService(self.config['client_secrets_file'])
+            self._youtube_api = YouTubeAPIService.from_config(self.config)
         return self._youtube_api
 
     def initialize_tools(self):
         self.model = self.config['model']
         self.db = Database(self.config['database_path'])
-        self.yt_dlp_service = YTDLPService()
+        self.yt_dlp_service = YTDLPService.from_config(self.config)
         update_playlist_tool = UpdatePlaylistTool(self.db, self.youtube_api)
         update_all_playlists_tool = UpdateAllPlaylistsTool(self.db, self.youtube_api)
         stash_video_tool = StashVideoTool(self.yt_dlp_service)
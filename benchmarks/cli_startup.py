@@ -0,0 +1,121 @@
+"""
+Measures how long main.py takes to start, and fails when it goes over budget.
+
+Each scenario runs the CLI in a fresh interpreter several times; the median wall time, less
+that of a bare interpreter on the same machine, is compared against the budget, and
+`python -X importtime` is used to check that none of the heavy modules a scenario has no use
+for were imported. Commands run in a scratch directory holding a copy of controls.toml, so
+the files they open (such as the quota ledger) don't touch the checkout. Exits non-zero on
+any regression, so it can run in CI or before a release:
+
+    python benchmarks/cli_startup.py [--budget-ms 150] [--runs 7]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that cost hundreds of milliseconds to import and are only needed by some commands
+HEAVY_MODULES = ('googleapiclient', 'google_auth_oauthlib', 'yt_dlp', 'litellm')
+
+# (CLI arguments, heavy modules the scenario is allowed to import)
+SCENARIOS = [
+    (['--help'], ()),
+    (['auth', '--help'], ()),
+    (['stash-playlist', '--help'], ()),
+    (['resume-stash', '--help'], ()),
+    (['quota-status', '--help'], ()),
+    # Reads the local quota ledger only; no API client or network
+    (['quota-status'], ()),
+]
+
+
+def run_python(args, cwd, importtime=False):
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += args
+    started = time.perf_counter()
+    completed = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} exited with {completed.returncode}:\n{completed.stderr}")
+    return elapsed, completed.stderr
+
+
+def run_cli(args, cwd, importtime=False):
+    return run_python([os.path.join(REPO_ROOT, 'main.py'), *args], cwd, importtime)
+
+
+def median_ms(run, runs):
+    run()  # warm up the bytecode and filesystem caches
+    return statistics.median(run()[0] for _ in range(runs)) * 1000
+
+
+def imported_modules(importtime_output):
+    """Returns {top-level module: cumulative microseconds} from -X importtime output."""
+    modules = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        # A package's own line carries the cumulative cost of everything imported under it
+        top = name.strip().split('.')[0]
+        modules[top] = max(modules.get(top, 0), int(cumulative))
+    return modules
+
+
+def run_scenarios(args, work_dir):
+    """Times every scenario and returns a description of each budget or import failure."""
+    interpreter_ms = median_ms(lambda: run_python(['-c', 'pass'], work_dir), args.runs)
+    print(f"{'python -c pass':<28} median {interpreter_ms:7.1f} ms")
+
+    failures = []
+    for cli_args, allowed in SCENARIOS:
+        label = ' '.join(cli_args)
+        startup_ms = median_ms(lambda: run_cli(cli_args, work_dir), args.runs) - interpreter_ms
+
+        modules = imported_modules(run_cli(cli_args, work_dir, importtime=True)[1])
+        unexpected = [name for name in HEAVY_MODULES if name in modules and name not in allowed]
+
+        status = 'ok'
+        if startup_ms > args.budget_ms:
+            status = 'OVER BUDGET'
+            failures.append(f"{label}: {startup_ms:.0f} ms > {args.budget_ms:.0f} ms")
+        if unexpected:
+            status = 'HEAVY IMPORTS'
+            failures.append(f"{label}: imports {', '.join(unexpected)}")
+        print(f"{label:<28} median {startup_ms:+7.1f} ms  [{status}]")
+        for name in unexpected:
+            print(f"  {name}: {modules[name] / 1000:.1f} ms")
+    return failures
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=150, help='Median startup time allowed per scenario, over a bare interpreter')
+    parser.add_argument('--runs', type=int, default=7, help='Timed runs per scenario')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        shutil.copy(os.path.join(REPO_ROOT, 'controls.toml'), work_dir)
+        failures = run_scenarios(args, work_dir)
+
+    if failures:
+        print("\nStartup budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nAll scenarios within {args.budget_ms:.0f} ms of a bare interpreter.")
+
+if __name__ == '__main__':
+    main()
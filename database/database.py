@@ -1,16 +1,27 @@
 from datetime import datetime
 import hashlib
 import json
+import os
+import socket
 import sqlite3
 
-class Database:
-    def __init__(self, db_path):
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
+BULK_CHUNK_SIZE = 500  # rows written per transaction by the bulk upserts
 
-    def create_tables(self):
-        self.cursor.execute('''
+# Applied once per connection. WAL lets readers run alongside the writer and,
+# with synchronous=NORMAL, turns each commit into an append instead of an fsync.
+CONNECTION_PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -65536',  # 64 MiB page cache
+    'PRAGMA temp_store = MEMORY',
+]
+
+# Ordered schema migrations; entry N brings the schema to version N + 1.
+# Append new migrations, never edit applied ones.
+SCHEMA_MIGRATIONS = [
+    # 1: baseline schema (databases created before versioning already have these tables)
+    [
+        '''
             CREATE TABLE IF NOT EXISTS playlists (
                 id TEXT PRIMARY KEY,
                 title TEXT,
@@ -22,8 +33,8 @@ class Database:
                 last_fetched TIMESTAMP,
                 content_hash TEXT
             )
-        ''')
-        self.cursor.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS videos (
                 id TEXT PRIMARY KEY,
                 playlist_id TEXT,
@@ -42,16 +53,16 @@ class Database:
                 file_hash TEXT,
                 FOREIGN KEY (playlist_id) REFERENCES playlists (id)
             )
-        ''')
-        self.cursor.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS delta_jobs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 timestamp TEXT,
                 content_hash TEXT,
                 delta_data JSON
             )
-        ''')
-        self.cursor.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS downloads (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 video_id TEXT,
@@ -60,46 +71,301 @@ class Database:
                 download_date TIMESTAMP,
                 FOREIGN KEY (video_id) REFERENCES videos (id)
             )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS playlist_items (
+                id TEXT PRIMARY KEY,
+                playlist_id TEXT,
+                video_id TEXT,
+                position INTEGER,
+                added_at TIMESTAMP,
+                last_resolved TIMESTAMP,
+                removed_at TIMESTAMP,
+                FOREIGN KEY (playlist_id) REFERENCES playlists (id)
+            )
+        ''',
+    ],
+    # 2: indexes for the lookups in the sync and stash loops
+    [
+        'CREATE INDEX IF NOT EXISTS idx_videos_playlist_id ON videos (playlist_id)',
+        'CREATE INDEX IF NOT EXISTS idx_videos_file_hash ON videos (file_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_downloads_video_id ON downloads (video_id)',
+        'CREATE INDEX IF NOT EXISTS idx_downloads_file_hash ON downloads (file_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_playlist_items_playlist_id ON playlist_items (playlist_id, removed_at)',
+    ],
+    # 3: persistent download queue, so interrupted stash runs can resume without re-planning
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS download_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                playlist_id TEXT,
+                output_path TEXT,
+                audio_only BOOLEAN,
+                downloads_per_hour REAL,
+                burst INTEGER,
+                skipped INTEGER DEFAULT 0,
+                status TEXT DEFAULT 'active',
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS download_queue (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id INTEGER,
+                video_id TEXT,
+                status TEXT DEFAULT 'pending',
+                attempts INTEGER DEFAULT 0,
+                last_error TEXT,
+                claimed_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                UNIQUE (job_id, video_id),
+                FOREIGN KEY (job_id) REFERENCES download_jobs (id)
+            )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_download_queue_job_status ON download_queue (job_id, status)',
+    ],
+    # 4: BLAKE2b digest of downloaded files, computed alongside the legacy MD5 file_hash
+    [
+        'ALTER TABLE downloads ADD COLUMN file_blake2b TEXT',
+    ],
+    # 5: content store used by a stash job (NULL when files are stored directly in the output folder)
+    [
+        'ALTER TABLE download_jobs ADD COLUMN store_path TEXT',
+    ],
+    # 6: audio mode of a stash job and CPU time per queue item, to compare transcoding with remuxing
+    [
+        'ALTER TABLE download_jobs ADD COLUMN audio_mode TEXT',
+        'ALTER TABLE download_queue ADD COLUMN cpu_seconds REAL',
+    ],
+    # 7: download pacing learned by adaptive throttling, carried over between runs
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS throttle_state (
+                name TEXT PRIMARY KEY,
+                downloads_per_hour REAL,
+                concurrency INTEGER,
+                updated_at TIMESTAMP
+            )
+        ''',
+    ],
+    # 8: process holding each claimed queue item, so resuming leaves live claims alone
+    [
+        'ALTER TABLE download_queue ADD COLUMN claimed_by TEXT',
+    ],
+]
+
+MAX_DOWNLOAD_ATTEMPTS = 3  # failed queue items are retried on resume until they reach this many attempts
+
+
+def claim_owner():
+    """Identifies this process in download_queue.claimed_by, as host:pid."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_is_live(claimed_by):
+    """
+    Returns whether the process that claimed a queue item is still running. SQLite in WAL
+    mode needs every process on one host, so claims from another host (or made before
+    claims were recorded) are stale.
+    """
+    host, _, pid = (claimed_by or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    if int(pid) == os.getpid():
+        return True
+    if os.name == 'nt':
+        # Signal 0 would interrupt the process on Windows; assume the claim is live
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Database:
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+        self.cursor = self.conn.cursor()
+        self.configure_connection()
+        self.migrate()
+
+    def configure_connection(self):
+        for pragma in CONNECTION_PRAGMAS:
+            self.cursor.execute(pragma)
+
+    def get_schema_version(self):
+        self.cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        return self.cursor.fetchone()[0]
+
+    def migrate(self):
+        """Applies the schema migrations newer than the recorded schema version, each in its own transaction."""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                applied_at TIMESTAMP
+            )
         ''')
         self.conn.commit()
 
+        current_version = self.get_schema_version()
+        for version, statements in enumerate(SCHEMA_MIGRATIONS, start=1):
+            if version <= current_version:
+                continue
+            try:
+                self.cursor.execute('BEGIN')
+                for statement in statements:
+                    self.cursor.execute(statement)
+                self.cursor.execute(
+                    'INSERT INTO schema_version (version, applied_at) VALUES (?, ?)',
+                    (version, datetime.now().isoformat())
+                )
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
+
     def generate_hash(self, data):
         return hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()
 
     def update_playlist(self, playlist_id, title, description, channel_id, channel_title, item_count):
-        data = {
+        playlist = {
+            'id': playlist_id,
             'title': title,
             'description': description,
             'channel_id': channel_id,
             'channel_title': channel_title,
             'item_count': item_count
         }
-        content_hash = self.generate_hash(data)
-        
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO playlists (id, title, description, channel_id, channel_title, item_count, last_updated, last_fetched, content_hash)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (playlist_id, title, description, channel_id, channel_title, item_count, datetime.now(), datetime.now(), content_hash))
-        self.conn.commit()
-        return content_hash
+        return self.upsert_playlists([playlist])['hashes'][playlist_id]
 
     def update_video(self, video_id, playlist_id, title, description, published_at, channel_id, channel_title, view_count, like_count, comment_count, duration):
-        data = {
+        video = {
+            'id': video_id,
             'title': title,
             'description': description,
-            'published_at': published_at.isoformat(),
+            'published_at': published_at,
             'channel_id': channel_id,
             'channel_title': channel_title,
+            'view_count': view_count,
+            'like_count': like_count,
+            'comment_count': comment_count,
             'duration': duration
         }
-        content_hash = self.generate_hash(data)
-        
-        self.cursor.execute('''
-            INSERT OR REPLACE INTO videos (id, playlist_id, title, description, published_at, channel_id, channel_title, view_count, like_count, comment_count, duration, last_updated, content_hash)
+        return self.upsert_videos(playlist_id, [video])['hashes'][video_id]
+
+    def playlist_content_hash(self, playlist):
+        return self.generate_hash({
+            'title': playlist['title'],
+            'description': playlist['description'],
+            'channel_id': playlist['channel_id'],
+            'channel_title': playlist['channel_title'],
+            'item_count': playlist['item_count']
+        })
+
+    def video_content_hash(self, video):
+        return self.generate_hash({
+            'title': video['title'],
+            'description': video['description'],
+            'published_at': video['published_at'].isoformat(),
+            'channel_id': video['channel_id'],
+            'channel_title': video['channel_title'],
+            'duration': video['duration']
+        })
+
+    def upsert_playlists(self, playlists, chunk_size=BULK_CHUNK_SIZE):
+        """
+        Writes new or changed playlist records with one executemany per chunk, committing once per chunk.
+        Returns the content hashes and the IDs that were inserted, updated or left unchanged.
+        """
+        records = {playlist['id']: playlist for playlist in playlists}
+        result = self._classify_upsert('playlists', records, self.playlist_content_hash)
+        now = datetime.now()
+        rows = [
+            (playlist['id'], playlist['title'], playlist['description'], playlist['channel_id'],
+             playlist['channel_title'], playlist['item_count'], now, now, result['hashes'][playlist['id']])
+            for playlist in (records[playlist_id] for playlist_id in result['inserted'] + result['updated'])
+        ]
+        self._executemany_chunked('''
+            INSERT INTO playlists (id, title, description, channel_id, channel_title, item_count, last_updated, last_fetched, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                title = excluded.title,
+                description = excluded.description,
+                channel_id = excluded.channel_id,
+                channel_title = excluded.channel_title,
+                item_count = excluded.item_count,
+                last_updated = excluded.last_updated,
+                last_fetched = excluded.last_fetched,
+                content_hash = excluded.content_hash
+            WHERE playlists.content_hash IS NOT excluded.content_hash
+        ''', rows, chunk_size)
+        return result
+
+    def upsert_videos(self, playlist_id, videos, chunk_size=BULK_CHUNK_SIZE):
+        """
+        Writes new or changed video records with one executemany per chunk, committing once per chunk.
+        Rows whose content_hash is unchanged are not rewritten, and the download state
+        (downloaded, file_hash) of existing rows is never touched.
+        Returns the content hashes and the IDs that were inserted, updated or left unchanged.
+        """
+        records = {video['id']: video for video in videos}
+        result = self._classify_upsert('videos', records, self.video_content_hash)
+        now = datetime.now()
+        rows = [
+            (video['id'], playlist_id, video['title'], video['description'], video['published_at'],
+             video['channel_id'], video['channel_title'], video['view_count'], video['like_count'],
+             video['comment_count'], video['duration'], now, result['hashes'][video['id']])
+            for video in (records[video_id] for video_id in result['inserted'] + result['updated'])
+        ]
+        self._executemany_chunked('''
+            INSERT INTO videos (id, playlist_id, title, description, published_at, channel_id, channel_title, view_count, like_count, comment_count, duration, last_updated, content_hash)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (video_id, playlist_id, title, description, published_at, channel_id, channel_title, view_count, like_count, comment_count, duration, datetime.now(), content_hash))
-        self.conn.commit()
-        return content_hash
+            ON CONFLICT (id) DO UPDATE SET
+                playlist_id = excluded.playlist_id,
+                title = excluded.title,
+                description = excluded.description,
+                published_at = excluded.published_at,
+                channel_id = excluded.channel_id,
+                channel_title = excluded.channel_title,
+                view_count = excluded.view_count,
+                like_count = excluded.like_count,
+                comment_count = excluded.comment_count,
+                duration = excluded.duration,
+                last_updated = excluded.last_updated,
+                content_hash = excluded.content_hash
+            WHERE videos.content_hash IS NOT excluded.content_hash
+        ''', rows, chunk_size)
+        return result
+
+    def _classify_upsert(self, table, records, hash_record):
+        hashes = {record_id: hash_record(record) for record_id, record in records.items()}
+        self.cursor.execute(
+            f'SELECT id, content_hash FROM {table} WHERE id IN (SELECT value FROM json_each(?))',
+            (json.dumps(list(records)),)
+        )
+        existing = dict(self.cursor.fetchall())
+        result = {'hashes': hashes, 'inserted': [], 'updated': [], 'unchanged': []}
+        for record_id, content_hash in hashes.items():
+            if record_id not in existing:
+                result['inserted'].append(record_id)
+            elif existing[record_id] != content_hash:
+                result['updated'].append(record_id)
+            else:
+                result['unchanged'].append(record_id)
+        return result
+
+    def _executemany_chunked(self, sql, rows, chunk_size):
+        for i in range(0, len(rows), chunk_size):
+            try:
+                self.cursor.executemany(sql, rows[i:i + chunk_size])
+                self.conn.commit()
+            except sqlite3.Error:
+                self.conn.rollback()
+                raise
 
     def update_video_download_status(self, video_id, downloaded, file_hash):
         self.cursor.execute('''
@@ -133,11 +399,96 @@ class Database:
         result = self.cursor.fetchone()
         return result[0] if result else None
 
+    def get_playlist_items(self, playlist_id):
+        """Returns the active items of a playlist as {playlist_item_id: (video_id, position)}."""
+        self.cursor.execute('''
+            SELECT id, video_id, position FROM playlist_items
+            WHERE playlist_id = ? AND removed_at IS NULL
+        ''', (playlist_id,))
+        return {row[0]: (row[1], row[2]) for row in self.cursor.fetchall()}
+
+    def get_playlist_memberships(self):
+        """Returns {video_id: [playlist_id, ...]} over the active items of every synced playlist."""
+        self.cursor.execute('''
+            SELECT video_id, playlist_id FROM playlist_items
+            WHERE removed_at IS NULL
+            GROUP BY video_id, playlist_id
+            ORDER BY video_id, MIN(position)
+        ''')
+        memberships = {}
+        for video_id, playlist_id in self.cursor.fetchall():
+            memberships.setdefault(video_id, []).append(playlist_id)
+        return memberships
+
+    def get_stale_playlist_video_ids(self, playlist_id, older_than):
+        self.cursor.execute('''
+            SELECT DISTINCT video_id FROM playlist_items
+            WHERE playlist_id = ? AND removed_at IS NULL
+              AND (last_resolved IS NULL OR last_resolved < ?)
+        ''', (playlist_id, older_than))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def save_playlist_items(self, playlist_id, items, resolved_video_ids=()):
+        """
+        Stores the current items of a playlist and records items no longer present as removed.
+        Returns the video IDs that were added to and removed from the playlist.
+        """
+        now = datetime.now()
+        existing = self.get_playlist_items(playlist_id)
+        current_ids = {item['id'] for item in items}
+
+        added = [item['video_id'] for item in items if item['id'] not in existing]
+        removed = [video_id for item_id, (video_id, _) in existing.items() if item_id not in current_ids]
+
+        self.cursor.executemany('''
+            INSERT INTO playlist_items (id, playlist_id, video_id, position, added_at, last_resolved, removed_at)
+            VALUES (?, ?, ?, ?, ?, ?, NULL)
+            ON CONFLICT (id) DO UPDATE SET
+                position = excluded.position,
+                removed_at = NULL,
+                last_resolved = COALESCE(excluded.last_resolved, playlist_items.last_resolved)
+        ''', [
+            (item['id'], playlist_id, item['video_id'], item['position'], now,
+             now if item['video_id'] in resolved_video_ids else None)
+            for item in items
+        ])
+        self.cursor.executemany(
+            'UPDATE playlist_items SET removed_at = ? WHERE id = ?',
+            [(now, item_id) for item_id in existing if item_id not in current_ids]
+        )
+        self.conn.commit()
+        return {'added': added, 'removed': removed}
+
     def get_video_download_status(self, video_id):
         self.cursor.execute('SELECT downloaded, file_hash FROM videos WHERE id = ?', (video_id,))
         result = self.cursor.fetchone()
         return result if result else (False, None)
 
+    def get_download_states(self, video_ids=None, playlist_id=None):
+        """
+        Returns the download state of many videos in a single query, as
+        {video_id: {'downloaded', 'file_hash', 'download_count'}}.
+        Pass the video IDs to look up, or a playlist_id to use its current items.
+        """
+        if video_ids is not None:
+            id_source = 'SELECT DISTINCT value AS video_id FROM json_each(?)'
+            params = (json.dumps(list(video_ids)),)
+        else:
+            id_source = 'SELECT DISTINCT video_id FROM playlist_items WHERE playlist_id = ? AND removed_at IS NULL'
+            params = (playlist_id,)
+
+        self.cursor.execute(f'''
+            SELECT ids.video_id, COALESCE(v.downloaded, 0), v.file_hash, COUNT(d.id)
+            FROM ({id_source}) ids
+            LEFT JOIN videos v ON v.id = ids.video_id
+            LEFT JOIN downloads d ON d.video_id = ids.video_id
+            GROUP BY ids.video_id
+        ''', params)
+        return {
+            row[0]: {'downloaded': bool(row[1]), 'file_hash': row[2], 'download_count': row[3]}
+            for row in self.cursor.fetchall()
+        }
+
     def get_video_by_file_hash(self, file_hash):
         self.cursor.execute('SELECT id FROM videos WHERE file_hash = ?', (file_hash,))
         result = self.cursor.fetchone()
@@ -183,16 +534,209 @@ class Database:
             }
         return None
 
-    def add_download(self, video_id, file_path, file_hash):
+    def add_download(self, video_id, file_path, file_hash, file_blake2b=None):
+        self.add_downloads([(video_id, file_path, file_hash, file_blake2b)])
+
+    def add_downloads(self, downloads, chunk_size=BULK_CHUNK_SIZE):
+        """Records (video_id, file_path, file_hash, file_blake2b) tuples, committing once per chunk."""
+        now = datetime.now()
+        self._executemany_chunked('''
+            INSERT INTO downloads (video_id, file_path, file_hash, file_blake2b, download_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (video_id, file_path, file_hash, file_blake2b, now)
+            for video_id, file_path, file_hash, file_blake2b in downloads
+        ], chunk_size)
+
+    def create_download_job(self, playlist_id, output_path, audio_only, video_ids, downloads_per_hour=None, burst=1, skipped=0, store_path=None, audio_mode=None):
+        """
+        Persists a planned stash run and queues its videos as pending. Returns the job ID.
+        An active job for the same playlist (or, for playlist_id None, for all playlists), as an
+        interrupted run leaves behind, is taken over instead: it gets this run's settings and
+        videos, so two jobs never download the same playlist.
+        """
+        now = datetime.now()
+        try:
+            job = self.get_active_download_job(playlist_id)
+            if job:
+                job_id = job['id']
+                self.cursor.execute('''
+                    UPDATE download_jobs SET output_path = ?, audio_only = ?, downloads_per_hour = ?, burst = ?, skipped = ?, updated_at = ?, store_path = ?, audio_mode = ?
+                    WHERE id = ?
+                ''', (output_path, audio_only, downloads_per_hour, burst, skipped, now, store_path, audio_mode, job_id))
+            else:
+                self.cursor.execute('''
+                    INSERT INTO download_jobs (playlist_id, output_path, audio_only, downloads_per_hour, burst, skipped, status, created_at, updated_at, store_path, audio_mode)
+                    VALUES (?, ?, ?, ?, ?, ?, 'active', ?, ?, ?, ?)
+                ''', (playlist_id, output_path, audio_only, downloads_per_hour, burst, skipped, now, now, store_path, audio_mode))
+                job_id = self.cursor.lastrowid
+            self.cursor.executemany(
+                'INSERT OR IGNORE INTO download_queue (job_id, video_id) VALUES (?, ?)',
+                [(job_id, video_id) for video_id in video_ids]
+            )
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+        return job_id
+
+    def get_download_job(self, job_id):
         self.cursor.execute('''
-            INSERT INTO downloads (video_id, file_path, file_hash, download_date)
+            SELECT id, playlist_id, output_path, audio_only, downloads_per_hour, burst, skipped, status, created_at, updated_at, store_path, audio_mode
+            FROM download_jobs WHERE id = ?
+        ''', (job_id,))
+        result = self.cursor.fetchone()
+        if result:
+            return {
+                'id': result[0],
+                'playlist_id': result[1],
+                'output_path': result[2],
+                'audio_only': bool(result[3]),
+                'downloads_per_hour': result[4],
+                'burst': result[5],
+                'skipped': result[6],
+                'status': result[7],
+                'created_at': result[8],
+                'updated_at': result[9],
+                'store_path': result[10],
+                'audio_mode': result[11]
+            }
+        return None
+
+    def get_active_download_job(self, playlist_id):
+        """Returns the latest active job for a playlist, or for all playlists when playlist_id is None."""
+        self.cursor.execute(
+            "SELECT id FROM download_jobs WHERE status = 'active' AND playlist_id IS ? ORDER BY id DESC LIMIT 1", (playlist_id,)
+        )
+        result = self.cursor.fetchone()
+        return self.get_download_job(result[0]) if result else None
+
+    def get_latest_active_download_job(self):
+        self.cursor.execute("SELECT id FROM download_jobs WHERE status = 'active' ORDER BY id DESC LIMIT 1")
+        result = self.cursor.fetchone()
+        return self.get_download_job(result[0]) if result else None
+
+    def get_download_queue_counts(self, job_id):
+        """Returns the number of queue items of a job per state (pending, in_progress, done, failed)."""
+        self.cursor.execute(
+            'SELECT status, COUNT(*) FROM download_queue WHERE job_id = ? GROUP BY status', (job_id,)
+        )
+        counts = {'pending': 0, 'in_progress': 0, 'done': 0, 'failed': 0}
+        counts.update(dict(self.cursor.fetchall()))
+        return counts
+
+    def get_download_queue_video_ids(self, job_id, status):
+        self.cursor.execute(
+            'SELECT video_id FROM download_queue WHERE job_id = ? AND status = ? ORDER BY id', (job_id, status)
+        )
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def reset_download_queue(self, job_id, max_attempts=MAX_DOWNLOAD_ATTEMPTS):
+        """
+        Prepares a job for resuming: items left in_progress by a run that is no longer running,
+        and failed items with attempts to spare, go back to pending. Items claimed by a live
+        process are left to it. Returns the number of items reset.
+        """
+        self.cursor.execute(
+            "SELECT id, claimed_by FROM download_queue WHERE job_id = ? AND status = 'in_progress'", (job_id,)
+        )
+        stale_ids = [item_id for item_id, claimed_by in self.cursor.fetchall() if not claim_is_live(claimed_by)]
+        self.cursor.execute('''
+            UPDATE download_queue SET status = 'pending', claimed_at = NULL, claimed_by = NULL
+            WHERE job_id = ? AND (id IN (SELECT value FROM json_each(?)) OR (status = 'failed' AND attempts < ?))
+        ''', (job_id, json.dumps(stale_ids), max_attempts))
+        reset = self.cursor.rowcount
+        self.cursor.execute(
+            "UPDATE download_jobs SET status = 'active', updated_at = ? WHERE id = ?", (datetime.now(), job_id)
+        )
+        self.conn.commit()
+        return reset
+
+    def claim_download_item(self, job_id):
+        """
+        Atomically moves the next pending item of a job to in_progress and returns its video ID,
+        or None when nothing is pending. Safe against other processes working the same queue.
+        Items whose video has been downloaded since they were queued (e.g. by another job) are
+        marked done instead of being handed out.
+        """
+        while True:
+            now = datetime.now()
+            self.cursor.execute('''
+                UPDATE download_queue SET status = 'in_progress', attempts = attempts + 1, claimed_at = ?, claimed_by = ?
+                WHERE id = (
+                    SELECT id FROM download_queue WHERE job_id = ? AND status = 'pending' ORDER BY id LIMIT 1
+                ) AND status = 'pending'
+                RETURNING id, video_id, EXISTS (SELECT 1 FROM downloads WHERE downloads.video_id = download_queue.video_id)
+            ''', (now, claim_owner(), job_id))
+            result = self.cursor.fetchone()
+            if result and result[2]:
+                self.cursor.execute(
+                    "UPDATE download_queue SET status = 'done', finished_at = ? WHERE id = ?", (now, result[0])
+                )
+            self.conn.commit()
+            if not result:
+                return None
+            if not result[2]:
+                return result[1]
+
+    def finish_download_item(self, job_id, video_id, status, error=None, file_path=None, file_hash=None, file_blake2b=None, cpu_seconds=None):
+        """
+        Marks a claimed item done or failed. A completed download is recorded in the same
+        transaction, so a crash never leaves a stored file with its item still in progress.
+        """
+        now = datetime.now()
+        try:
+            if status == 'done':
+                self.cursor.execute('''
+                    INSERT INTO downloads (video_id, file_path, file_hash, file_blake2b, download_date)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (video_id, file_path, file_hash, file_blake2b, now))
+            self.cursor.execute('''
+                UPDATE download_queue SET status = ?, last_error = ?, finished_at = ?, cpu_seconds = ?
+                WHERE job_id = ? AND video_id = ?
+            ''', (status, error, now, cpu_seconds, job_id, video_id))
+            self.cursor.execute('UPDATE download_jobs SET updated_at = ? WHERE id = ?', (now, job_id))
+            self.conn.commit()
+        except sqlite3.Error:
+            self.conn.rollback()
+            raise
+
+    def finish_download_job(self, job_id, max_attempts=MAX_DOWNLOAD_ATTEMPTS):
+        """
+        Marks a job completed once none of its items are pending, in progress, or failed with
+        attempts to spare; a job with retryable failures stays active for resume-stash.
+        """
+        self.cursor.execute('''
+            UPDATE download_jobs SET status = 'completed', updated_at = ?
+            WHERE id = ? AND NOT EXISTS (
+                SELECT 1 FROM download_queue
+                WHERE job_id = ? AND (status IN ('pending', 'in_progress') OR (status = 'failed' AND attempts < ?))
+            )
+        ''', (datetime.now(), job_id, job_id, max_attempts))
+        self.conn.commit()
+        return self.cursor.rowcount > 0
+
+    def get_throttle_state(self, name='downloads'):
+        self.cursor.execute('SELECT downloads_per_hour, concurrency, updated_at FROM throttle_state WHERE name = ?', (name,))
+        result = self.cursor.fetchone()
+        if result:
+            return {'downloads_per_hour': result[0], 'concurrency': result[1], 'updated_at': result[2]}
+        return None
+
+    def save_throttle_state(self, state, name='downloads'):
+        self.cursor.execute('''
+            INSERT INTO throttle_state (name, downloads_per_hour, concurrency, updated_at)
             VALUES (?, ?, ?, ?)
-        ''', (video_id, file_path, file_hash, datetime.now()))
+            ON CONFLICT (name) DO UPDATE SET
+                downloads_per_hour = excluded.downloads_per_hour,
+                concurrency = excluded.concurrency,
+                updated_at = excluded.updated_at
+        ''', (name, state['downloads_per_hour'], state['concurrency'], datetime.now()))
         self.conn.commit()
 
     def get_download_by_file_hash(self, file_hash):
         self.cursor.execute('''
-            SELECT d.*, v.title, v.channel_title
+            SELECT d.id, d.video_id, d.file_path, d.file_hash, d.download_date, v.title, v.channel_title, d.file_blake2b
             FROM downloads d
             LEFT JOIN videos v ON d.video_id = v.id
             WHERE d.file_hash = ?
@@ -206,10 +750,30 @@ class Database:
                 'file_hash': result[3],
                 'download_date': result[4],
                 'video_title': result[5],
-                'channel_title': result[6]
+                'channel_title': result[6],
+                'file_blake2b': result[7]
             }
         return None
 
+    def get_latest_downloads(self, video_ids):
+        """Returns the most recent download of each video, as {video_id: {'file_path', 'file_hash', 'file_blake2b'}}."""
+        self.cursor.execute('''
+            SELECT d.video_id, d.file_path, d.file_hash, d.file_blake2b
+            FROM downloads d
+            JOIN (
+                SELECT MAX(id) AS id FROM downloads
+                WHERE video_id IN (SELECT value FROM json_each(?))
+                GROUP BY video_id
+            ) latest ON latest.id = d.id
+        ''', (json.dumps(list(video_ids)),))
+        return {
+            row[0]: {'file_path': row[1], 'file_hash': row[2], 'file_blake2b': row[3]}
+            for row in self.cursor.fetchall()
+        }
+
     def get_downloads_for_video(self, video_id):
-        self.cursor.execute('SELECT * FROM downloads WHERE video_id = ?', (video_id,))
+        self.cursor.execute('''
+            SELECT id, video_id, file_path, file_hash, download_date, file_blake2b
+            FROM downloads WHERE video_id = ?
+        ''', (video_id,))
         return self.cursor.fetchall()
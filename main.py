@@ -1,20 +1,6 @@
 import click
 
-from database.database import Database
-from services.youtube_api_service import YouTubeAPIService
-from services.yt_dlp_service import YTDLPService
-from config import load_config
-from agents.commands import (
-    update_playlist_command,
-    update_all_playlists_command,
-    stash_video_command,
-    check_playlist_delta_command,
-    stash_playlist_command
-)
-
-from dotenv import load_dotenv
-
-load_dotenv()
+from services.service_registry import ServiceRegistry
 
 
 def ensure_authenticated(service, force=False):
@@ -37,19 +23,44 @@ def ensure_authenticated(service, force=False):
         service.authenticate_interactive()
         click.secho("Authentication successful!", fg='green')
 
+def load_settings(services):
+    # config loads .env and controls.toml when imported
+    from config import load_config
+    return load_config()
+
+def create_database(services):
+    from config import DATABASE_PATH
+    from database.database import Database
+    return Database(DATABASE_PATH)
+
+def create_youtube_api(services):
+    from services.youtube_api_service import YouTubeAPIService
+    return YouTubeAPIService.from_config(services['config'])
+
+def create_yt_dlp_service(services):
+    from services.yt_dlp_service import YTDLPService
+    return YTDLPService.from_config(services['config'])
+
+def create_quota_ledger(services):
+    from services.quota_ledger import QuotaLedger
+    return QuotaLedger.from_config(services['config'])
+
+SERVICE_FACTORIES = {
+    'config': load_settings,
+    'db': create_database,
+    'youtube_api': create_youtube_api,
+    'yt_dlp_service': create_yt_dlp_service,
+    'quota_ledger': create_quota_ledger,
+}
+
 @click.group()
 @click.pass_context
 def cli(ctx):
     """Stasher Agent CLI"""
+    # Services are built on first use, so each command imports and opens only what it needs
+    # (and --help none of them)
     if ctx.obj is None:
-        ctx.obj = {}
-    
-    config = load_config()
-    client_secrets_file = config['client_secrets_file']
-
-    ctx.obj['db'] = Database("youtube_playlists.db")
-    ctx.obj['youtube_api'] = YouTubeAPIService(client_secrets_file)
-    ctx.obj['yt_dlp_service'] = YTDLPService()
+        ctx.obj = ServiceRegistry(SERVICE_FACTORIES)
 
 @cli.command()
 @click.pass_context
@@ -59,18 +70,23 @@ def auth(ctx):
 
 @cli.command()
 @click.option('--playlist-id', prompt='Enter playlist ID', help='ID of the playlist to update')
+@click.option('--incremental/--full', default=None, help='Only resolve playlist items added since the last sync (defaults to incremental_sync in controls.toml)')
 @click.pass_context
-def update_playlist(ctx, playlist_id):
+def update_playlist(ctx, playlist_id, incremental):
     """Update a single playlist"""
+    from agents.commands import update_playlist_command
     ensure_authenticated(ctx.obj['youtube_api'])
-    update_playlist_command(ctx.obj, playlist_id)
+    update_playlist_command(ctx.obj, playlist_id, incremental)
 
 @cli.command()
+@click.option('--incremental/--full', default=None, help='Only resolve playlist items added since the last sync (defaults to incremental_sync in controls.toml)')
+@click.option('--workers', type=int, default=None, help='Number of playlists to sync concurrently (defaults to sync_workers in controls.toml)')
 @click.pass_context
-def update_all_playlists(ctx):
+def update_all_playlists(ctx, incremental, workers):
     """Update all playlists for a channel"""
+    from agents.commands import update_all_playlists_command
     ensure_authenticated(ctx.obj['youtube_api'])
-    update_all_playlists_command(ctx.obj)
+    update_all_playlists_command(ctx.obj, incremental, workers)
 
 @cli.command()
 @click.option('--video-url', prompt='Enter video URL', help='URL of the video to stash')
@@ -79,6 +95,7 @@ def update_all_playlists(ctx):
 @click.pass_context
 def stash_video(ctx, video_url, output_path, audio_only):
     """Stash a video or its audio"""
+    from agents.commands import stash_video_command
     ensure_authenticated(ctx.obj['youtube_api'])
     stash_video_command(ctx.obj, video_url, output_path, audio_only)
 
@@ -88,6 +105,7 @@ def stash_video(ctx, video_url, output_path, audio_only):
 @click.pass_context
 def check_playlist_delta(ctx, verbose, save):
     """Check for differences between local and remote playlists"""
+    from agents.commands import check_playlist_delta_command
     ensure_authenticated(ctx.obj['youtube_api'])
     check_playlist_delta_command(ctx.obj, verbose, save)
 
@@ -95,14 +113,65 @@ def check_playlist_delta(ctx, verbose, save):
 @click.option('--playlist-id', prompt='Enter playlist ID', help='ID of the playlist to stash')
 @click.option('--output-path', prompt='Enter output path', default='downloads', help='Path to save the stashed files')
 @click.option('--audio-only', is_flag=True, help='Stash audio only')
-@click.option('--batch-size', default=3, show_default=True, help='Number of videos to stash in each batch')
-@click.option('--batch-delay', default=1200, show_default=True, help='Delay in seconds between batches')
+@click.option('--batch-size', default=3, show_default=True, help='Number of videos that may start back to back (pacing burst)')
+@click.option('--batch-delay', default=1200, show_default=True, help='Seconds over which each batch is paced when --downloads-per-hour is not set')
 @click.option('--summary-interval', default=300, show_default=True, help='Interval in seconds between summary prints')
+@click.option('--workers', type=int, default=None, help='Number of concurrent downloads (defaults to download_workers in controls.toml)')
+@click.option('--downloads-per-hour', type=float, default=None, help='Download start rate (defaults to downloads_per_hour in controls.toml)')
+@click.option('--content-store/--no-content-store', default=None, help='Keep files once in a hash-named store under the output path and link them into playlist folders (defaults to content_store in controls.toml)')
+@click.option('--audio-mode', type=click.Choice(['transcode', 'remux']), default=None, help='For audio stashes, re-encode to MP3 or keep the native m4a/opus stream (defaults to audio_mode in controls.toml)')
+@click.option('--plan-only', is_flag=True, help='Queue the stash job and resolve every video ahead of time without downloading; start it later with resume-stash')
+@click.option('--adaptive/--fixed-pacing', default=None, help='Learn the download rate and concurrency from YouTube throttling errors, starting from the last run (defaults to adaptive_pacing in controls.toml)')
 @click.pass_context
-def stash_playlist(ctx, playlist_id, output_path, audio_only, batch_size, batch_delay, summary_interval):
+def stash_playlist(ctx, playlist_id, output_path, audio_only, batch_size, batch_delay, summary_interval, workers, downloads_per_hour, content_store, audio_mode, plan_only, adaptive):
     """Stash all videos in a playlist"""
+    from agents.commands import stash_playlist_command
     ensure_authenticated(ctx.obj['youtube_api'])
-    stash_playlist_command(ctx.obj, playlist_id, output_path, audio_only, batch_size, batch_delay, summary_interval)
+    stash_playlist_command(ctx.obj, playlist_id, output_path, audio_only, batch_size, batch_delay, summary_interval, workers, downloads_per_hour, content_store, audio_mode, plan_only, adaptive)
+
+@cli.command()
+@click.option('--output-path', prompt='Enter output path', default='downloads', help='Path under which each playlist gets its folder')
+@click.option('--audio-only', is_flag=True, help='Stash audio only')
+@click.option('--batch-size', default=3, show_default=True, help='Number of videos that may start back to back (pacing burst)')
+@click.option('--batch-delay', default=1200, show_default=True, help='Seconds over which each batch is paced when --downloads-per-hour is not set')
+@click.option('--summary-interval', default=300, show_default=True, help='Interval in seconds between summary prints')
+@click.option('--workers', type=int, default=None, help='Number of concurrent downloads (defaults to download_workers in controls.toml)')
+@click.option('--downloads-per-hour', type=float, default=None, help='Download start rate (defaults to downloads_per_hour in controls.toml)')
+@click.option('--content-store/--no-content-store', default=None, help='Keep files once in a hash-named store under the output path and link them into playlist folders (defaults to content_store in controls.toml)')
+@click.option('--audio-mode', type=click.Choice(['transcode', 'remux']), default=None, help='For audio stashes, re-encode to MP3 or keep the native m4a/opus stream (defaults to audio_mode in controls.toml)')
+@click.option('--plan-only', is_flag=True, help='Queue the stash job and resolve every video ahead of time without downloading; start it later with resume-stash')
+@click.option('--adaptive/--fixed-pacing', default=None, help='Learn the download rate and concurrency from YouTube throttling errors, starting from the last run (defaults to adaptive_pacing in controls.toml)')
+@click.pass_context
+def stash_all_playlists(ctx, output_path, audio_only, batch_size, batch_delay, summary_interval, workers, downloads_per_hour, content_store, audio_mode, plan_only, adaptive):
+    """Stash every synced playlist, downloading shared videos only once"""
+    from agents.commands import stash_all_playlists_command
+    stash_all_playlists_command(ctx.obj, output_path, audio_only, batch_size, batch_delay, summary_interval, workers, downloads_per_hour, content_store, audio_mode, plan_only, adaptive)
+
+@cli.command()
+@click.option('--job-id', type=int, default=None, help='ID of the stash job to resume (defaults to the latest unfinished job)')
+@click.option('--summary-interval', default=300, show_default=True, help='Interval in seconds between summary prints')
+@click.option('--workers', type=int, default=None, help='Number of concurrent downloads (defaults to download_workers in controls.toml)')
+@click.option('--downloads-per-hour', type=float, default=None, help='Download start rate (defaults to the rate the job was started with)')
+@click.option('--adaptive/--fixed-pacing', default=None, help='Learn the download rate and concurrency from YouTube throttling errors, starting from the last run (defaults to adaptive_pacing in controls.toml)')
+@click.pass_context
+def resume_stash(ctx, job_id, summary_interval, workers, downloads_per_hour, adaptive):
+    """Resume an interrupted playlist stash"""
+    from agents.commands import resume_stash_command
+    resume_stash_command(ctx.obj, job_id, summary_interval, workers, downloads_per_hour, adaptive)
+
+@cli.command()
+@click.pass_context
+def quota_status(ctx):
+    """Show today's YouTube API quota usage per command"""
+    from agents.commands import quota_status_command
+    quota_status_command(ctx.obj)
+
+@cli.command()
+@click.pass_context
+def refresh_discovery(ctx):
+    """Download the current YouTube API discovery document"""
+    from agents.commands import refresh_discovery_command
+    refresh_discovery_command(ctx.obj)
 
 @cli.command()
 @click.pass_context
@@ -0,0 +1,87 @@
+import threading
+import time
+
+# Substrings of yt-dlp errors that mean YouTube is limiting us rather than refusing one video
+THROTTLE_SIGNATURES = (
+    'http error 429',
+    'too many requests',
+    'http error 403',
+    'rate-limit',
+    'rate limit',
+    'throttl',
+    "confirm you're not a bot",
+    'confirm you’re not a bot',
+)
+
+DEFAULT_DOWNLOADS_PER_HOUR = 60
+
+
+def is_throttling_error(message):
+    message = (message or '').lower()
+    return any(signature in message for signature in THROTTLE_SIGNATURES)
+
+
+class AdaptiveThrottle:
+    """
+    AIMD controller for download pacing.
+    Every successful download raises the rate by `increase` downloads/hour, and every
+    `concurrency_step` successes in a row add a concurrent download, up to the limits.
+    A throttling error halves both (times `decrease`); errors arriving within `cooldown`
+    seconds of a cut are counted but not cut again, since they come from the same burst.
+    """
+
+    def __init__(self, downloads_per_hour=DEFAULT_DOWNLOADS_PER_HOUR, concurrency=1, max_concurrency=1,
+                 min_rate=6, max_rate=3600, increase=6, decrease=0.5, concurrency_step=5, cooldown=60):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.max_concurrency = max(1, max_concurrency)
+        self.downloads_per_hour = min(max(downloads_per_hour, min_rate), max_rate)
+        self.concurrency = min(max(1, concurrency), self.max_concurrency)
+        self.increase = increase
+        self.decrease = decrease
+        self.concurrency_step = concurrency_step
+        self.cooldown = cooldown
+        self.successes = 0
+        self.throttle_events = 0
+        self.cuts = 0
+        self._streak = 0
+        self._last_cut = None
+        self._lock = threading.Lock()
+
+    def record(self, result):
+        """Adjusts the rate from a download result; failures that aren't throttling leave it alone."""
+        if result['status'] == 'downloaded':
+            self.record_success()
+        elif result.get('throttled'):
+            self.record_throttle()
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self._streak += 1
+            self.downloads_per_hour = min(self.max_rate, self.downloads_per_hour + self.increase)
+            if self._streak >= self.concurrency_step and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self._streak = 0
+
+    def record_throttle(self):
+        with self._lock:
+            self.throttle_events += 1
+            self._streak = 0
+            now = time.monotonic()
+            if self._last_cut is not None and now - self._last_cut < self.cooldown:
+                return
+            self._last_cut = now
+            self.cuts += 1
+            self.downloads_per_hour = max(self.min_rate, self.downloads_per_hour * self.decrease)
+            self.concurrency = max(1, int(self.concurrency * self.decrease))
+
+    def state(self):
+        with self._lock:
+            return {
+                'downloads_per_hour': self.downloads_per_hour,
+                'concurrency': self.concurrency,
+                'successes': self.successes,
+                'throttle_events': self.throttle_events,
+                'cuts': self.cuts
+            }
@@ -0,0 +1,72 @@
+import os
+import threading
+
+CONTENT_STORE_DIR = '.stash-store'
+
+
+def link_file(source, dest):
+    """
+    Links source to dest, as a hardlink where possible and a symlink otherwise (e.g. across
+    devices). An existing file at dest is left alone. Returns 'hardlink', 'symlink' or 'existing'.
+    """
+    if os.path.lexists(dest):
+        return 'existing'
+    os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+    try:
+        os.link(source, dest)
+        return 'hardlink'
+    except OSError:
+        os.symlink(os.path.abspath(source), dest)
+        return 'symlink'
+
+
+class ContentStore:
+    """
+    Content-addressed file store: each distinct file is kept once, named by its hash
+    (sharded by the first two hex digits), and hardlinked into the folders that show it.
+    Links fall back to symlinks where hardlinks are not possible (e.g. across devices).
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+
+    @classmethod
+    def under(cls, output_path):
+        return cls(os.path.join(output_path, CONTENT_STORE_DIR))
+
+    def path_for(self, file_hash, ext):
+        return os.path.join(self.root, file_hash[:2], file_hash + ext)
+
+    def find(self, file_hash):
+        """Returns the stored path of the file with this hash, or None."""
+        if not file_hash:
+            return None
+        shard = os.path.join(self.root, file_hash[:2])
+        try:
+            with os.scandir(shard) as entries:
+                for entry in entries:
+                    if os.path.splitext(entry.name)[0] == file_hash:
+                        return entry.path
+        except FileNotFoundError:
+            pass
+        return None
+
+    def ingest(self, file_path, file_hash):
+        """
+        Moves a downloaded file into the store, or drops it if identical content is already
+        stored, and links the stored copy back in its place. Returns the stored path.
+        """
+        with self.lock:
+            stored = self.find(file_hash)
+            if stored is None:
+                stored = self.path_for(file_hash, os.path.splitext(file_path)[1])
+                os.makedirs(os.path.dirname(stored), exist_ok=True)
+                os.replace(file_path, stored)
+            else:
+                os.remove(file_path)
+            self.link(stored, file_path)
+        return stored
+
+    def link(self, stored, dest):
+        return link_file(stored, dest)
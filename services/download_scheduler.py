@@ -0,0 +1,134 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+import threading
+
+from services.rate_limiting import TokenBucket
+
+
+class DownloadScheduler:
+    """
+    Runs downloads on a pool of worker threads.
+    At most `workers` downloads run at once, and their starts are paced by a token
+    bucket refilled at downloads_per_hour (bursting up to `burst` downloads), instead
+    of sleeping a fixed delay between batches. Every download goes to YouTube, so
+    `workers` is the concurrency against it.
+    With an AdaptiveThrottle, the rate and the number of concurrent downloads (up to
+    `workers`) follow the throttle as it reacts to each result.
+    """
+
+    def __init__(self, workers=1, downloads_per_hour=None, burst=1, throttle=None):
+        self.workers = max(1, workers)
+        self.throttle = throttle
+        if throttle:
+            downloads_per_hour = throttle.downloads_per_hour
+        self.downloads_per_hour = downloads_per_hour
+        self.pacer = TokenBucket(downloads_per_hour / 3600, burst) if downloads_per_hour else None
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.bytes = 0
+        self.started_at = None
+
+    def run(self, jobs, download, on_tick=None, tick_interval=5.0, total=None, finish=None):
+        """
+        Downloads every job ({'video_id', ...}) with download(job) on the worker pool.
+        Yields each result dict on the calling thread as it completes, and calls on_tick()
+        at least every tick_interval seconds while waiting.
+        Jobs are drawn from the iterable on the calling thread only as workers free up, so it
+        may claim work lazily (e.g. from a persistent queue); pass its size as total if it is
+        not a sequence.
+        finish(result), if given, may return a future for follow-up work on the result (such
+        as hashing the file); the worker moves on to the next download and the future's
+        result is yielded in place of the download's once it is done.
+        Closing the generator (or an exception such as KeyboardInterrupt) stops it: workers
+        waiting on the pacer give up at once and no new download starts; the ones already
+        running finish before it returns, and their results are dropped.
+        """
+        if total is None:
+            jobs = list(jobs)
+            total = len(jobs)
+        jobs = iter(jobs)
+        self.total += total
+        self.started_at = self.started_at or datetime.now()
+
+        stop = threading.Event()
+
+        def work(job):
+            if self.pacer and not self.pacer.acquire(stop=stop):
+                return None
+            if stop.is_set():
+                return None
+            return download(job)
+
+        exhausted = False
+
+        def fill(executor, pending, finishing):
+            # Keeps as many downloads in flight as the current concurrency allows
+            nonlocal exhausted
+            limit = self.throttle.concurrency if self.throttle else self.workers
+            while not exhausted and len(pending - finishing) < limit:
+                job = next(jobs, None)
+                if job is None:
+                    exhausted = True
+                    return
+                pending.add(executor.submit(work, job))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            finishing = set()
+            try:
+                fill(executor, pending, finishing)
+                while pending:
+                    done, pending = wait(pending, timeout=tick_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        if future in finishing:
+                            finishing.discard(future)
+                        else:
+                            self._adapt(result)
+                            fill(executor, pending, finishing)
+                            follow_up = finish(result) if finish else None
+                            if follow_up is not None:
+                                finishing.add(follow_up)
+                                pending.add(follow_up)
+                                continue
+                        self._record(result)
+                        yield result
+                    if on_tick:
+                        on_tick()
+            finally:
+                # Runs before the executor waits for its workers
+                stop.set()
+
+    def _adapt(self, result):
+        if not self.throttle:
+            return
+        self.throttle.record(result)
+        self.downloads_per_hour = self.throttle.downloads_per_hour
+        self.pacer.set_rate(self.downloads_per_hour / 3600)
+
+    def _record(self, result):
+        if result['status'] == 'downloaded':
+            self.completed += 1
+            self.bytes += result.get('bytes') or 0
+        else:
+            self.failed += 1
+
+    def progress(self):
+        """Returns live throughput and an ETA for the remaining downloads."""
+        elapsed = datetime.now() - (self.started_at or datetime.now())
+        finished = self.completed + self.failed
+        seconds = elapsed.total_seconds()
+        per_hour = finished / (seconds / 3600) if seconds > 0 else 0
+        remaining = self.total - finished
+        eta = datetime.now() + timedelta(hours=remaining / per_hour) if per_hour > 0 and remaining else None
+        return {
+            'total': self.total,
+            'completed': self.completed,
+            'failed': self.failed,
+            'elapsed': elapsed,
+            'per_hour': per_hour,
+            'bytes_per_second': self.bytes / seconds if seconds > 0 else 0,
+            'eta': eta,
+            'throttle': self.throttle.state() if self.throttle else None
+        }
@@ -0,0 +1,34 @@
+import hashlib
+import os
+import time
+
+HASH_BUFFER_SIZE = 8 * 1024 * 1024
+
+
+def hash_file(file_path, buffer_size=HASH_BUFFER_SIZE):
+    """
+    Computes the MD5 and BLAKE2b digests of a file in a single pass.
+    Reads go into one reused buffer of buffer_size bytes; hashlib releases the GIL
+    while digesting, so hashing on a background thread overlaps other work.
+    Returns {'md5', 'blake2b', 'bytes', 'seconds'}.
+    """
+    started = time.monotonic()
+    md5 = hashlib.md5()
+    blake2b = hashlib.blake2b()
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(os.path.normpath(file_path), 'rb', buffering=0) as f:
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            md5.update(view[:read])
+            blake2b.update(view[:read])
+            size += read
+    return {
+        'md5': md5.hexdigest(),
+        'blake2b': blake2b.hexdigest(),
+        'bytes': size,
+        'seconds': time.monotonic() - started
+    }
@@ -0,0 +1,107 @@
+from collections import deque
+from contextlib import contextmanager
+import threading
+import time
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_CONNECTIONS = 8
+LATENCY_SAMPLES = 1024
+
+
+class HttpTransport:
+    """
+    Thread-safe pool of keep-alive httplib2 clients for API requests.
+    A client is checked out for one request at a time, since httplib2 is not thread-safe, and
+    returned with its connections still open, so later requests from any thread reuse them
+    instead of opening a new TLS connection. At most max_connections clients exist; requests
+    beyond that wait for one to be returned.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.timeout = timeout
+        self.max_connections = max(1, max_connections)
+        self._idle = []  # most recently used last, so the warmest connections are reused first
+        self._clients = 0
+        self._available = threading.Condition()
+        self.requests = 0
+        self.errors = 0
+        self.connections_opened = 0
+        self._seconds = 0.0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    @contextmanager
+    def connection(self, credentials):
+        """Yields an authorized client for one request, recording its latency."""
+        http = self._checkout()
+        open_connections = {id(conn) for conn in http.connections.values()}
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield AuthorizedHttp(credentials, http=http)
+        except (httplib2.HttpLib2Error, OSError):
+            # The connection may be left mid-response; don't hand it to the next request
+            failed = True
+            self._close_connections(http)
+            raise
+        finally:
+            opened = sum(1 for conn in http.connections.values() if id(conn) not in open_connections)
+            self._record(time.perf_counter() - started, opened, failed)
+            self._checkin(http)
+
+    def _checkout(self):
+        with self._available:
+            while not self._idle and self._clients >= self.max_connections:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._clients += 1
+        return httplib2.Http(timeout=self.timeout)
+
+    def _checkin(self, http):
+        with self._available:
+            self._idle.append(http)
+            self._available.notify()
+
+    @staticmethod
+    def _close_connections(http):
+        for conn in list(http.connections.values()):
+            conn.close()
+        http.connections.clear()
+
+    def _record(self, seconds, opened, failed):
+        with self._available:
+            self.requests += 1
+            self.errors += failed
+            self.connections_opened += opened
+            self._seconds += seconds
+            self._latencies.append(seconds)
+
+    def stats(self):
+        """Returns request counts, connections opened and latency percentiles (over recent requests)."""
+        with self._available:
+            latencies = sorted(self._latencies)
+            requests = self.requests
+
+            def percentile(fraction):
+                if not latencies:
+                    return 0.0
+                return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+            return {
+                'requests': requests,
+                'errors': self.errors,
+                'clients': self._clients,
+                'connections_opened': self.connections_opened,
+                'mean_ms': self._seconds / requests * 1000 if requests else 0.0,
+                'p50_ms': percentile(0.5),
+                'p95_ms': percentile(0.95),
+                'max_ms': latencies[-1] * 1000 if latencies else 0.0
+            }
+
+    def close(self):
+        with self._available:
+            for http in self._idle:
+                self._close_connections(http)
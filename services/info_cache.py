@@ -0,0 +1,80 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 3 * 3600  # below the ~6 hour lifetime of YouTube's signed format URLs
+
+
+class InfoCache:
+    """
+    SQLite-backed store of yt-dlp extraction results (info dicts with their chosen formats),
+    keyed by video ID and format selection. Entries expire after ttl_seconds, so a retry,
+    a resumed stash or a pre-planned queue can download without re-running extraction.
+    """
+
+    def __init__(self, db_path, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.create_tables()
+        self.purge_expired()
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS video_info (
+                    video_id TEXT,
+                    format_spec TEXT,
+                    info TEXT,
+                    fetched_at REAL,
+                    PRIMARY KEY (video_id, format_spec)
+                )
+            ''')
+            self.conn.commit()
+
+    def get(self, video_id, format_spec):
+        """Returns the cached info dict of a video for this format selection, or None if missing or expired."""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT info FROM video_info WHERE video_id = ? AND format_spec = ? AND fetched_at >= ?',
+                (video_id, format_spec, time.time() - self.ttl_seconds)
+            ).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return json.loads(row[0]) if row else None
+
+    def put(self, video_id, format_spec, info):
+        body = json.dumps(info)
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO video_info (video_id, format_spec, info, fetched_at)
+                VALUES (?, ?, ?, ?)
+            ''', (video_id, format_spec, body, time.time()))
+            self.conn.commit()
+
+    def invalidate(self, video_id):
+        with self.lock:
+            self.conn.execute('DELETE FROM video_info WHERE video_id = ?', (video_id,))
+            self.conn.commit()
+
+    def purge_expired(self):
+        with self.lock:
+            deleted = self.conn.execute(
+                'DELETE FROM video_info WHERE fetched_at < ?', (time.time() - self.ttl_seconds,)
+            ).rowcount
+            self.conn.commit()
+        if deleted:
+            logger.info(f"Purged {deleted} expired video info entries.")
+
+    def stats(self):
+        with self.lock:
+            entries = self.conn.execute('SELECT COUNT(*) FROM video_info').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
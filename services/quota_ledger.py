@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+import logging
+import sqlite3
+import threading
+import time
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+DAILY_QUOTA_LIMIT = 10000
+# The YouTube Data API quota day starts at midnight Pacific time
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+
+class QuotaExceededError(RuntimeError):
+    pass
+
+
+def current_quota_day():
+    return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+
+def next_quota_reset():
+    now = datetime.now(QUOTA_TIMEZONE)
+    return datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=QUOTA_TIMEZONE)
+
+
+class QuotaLedger:
+    """
+    Persistent record of the API quota units spent per quota day and API method.
+    Reservations run in BEGIN IMMEDIATE transactions, so several processes sharing
+    the ledger file never spend more than the daily limit between them.
+    """
+
+    def __init__(self, db_path, daily_limit=DAILY_QUOTA_LIMIT, policy='refuse'):
+        if policy not in ('refuse', 'defer'):
+            raise ValueError(f"Unknown quota policy: {policy}")
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.daily_limit = daily_limit
+        self.policy = policy
+        self.create_tables()
+
+    @classmethod
+    def from_config(cls, config):
+        """Returns the ledger configured in controls.toml, or None if quota_ledger_path is unset."""
+        if not config.get('quota_ledger_path'):
+            return None
+        return cls(
+            config['quota_ledger_path'],
+            daily_limit=config.get('daily_quota_limit', DAILY_QUOTA_LIMIT),
+            policy=config.get('quota_policy', 'refuse')
+        )
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode = WAL')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS quota_usage (
+                    quota_day TEXT,
+                    command TEXT,
+                    units INTEGER,
+                    calls INTEGER,
+                    PRIMARY KEY (quota_day, command)
+                )
+            ''')
+
+    def used(self, quota_day=None):
+        with self.lock:
+            return self._used(quota_day or current_quota_day())
+
+    def _used(self, quota_day):
+        row = self.conn.execute(
+            'SELECT COALESCE(SUM(units), 0) FROM quota_usage WHERE quota_day = ?', (quota_day,)
+        ).fetchone()
+        return row[0]
+
+    def usage_by_command(self, quota_day=None):
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT command, units, calls FROM quota_usage
+                WHERE quota_day = ? ORDER BY units DESC
+            ''', (quota_day or current_quota_day(),)).fetchall()
+        return [{'command': row[0], 'units': row[1], 'calls': row[2]} for row in rows]
+
+    def reserve(self, cost, command):
+        """
+        Records `cost` units for `command` against today's quota before the call is made.
+        If the call would exceed the daily limit it is refused with QuotaExceededError,
+        or, with the 'defer' policy, held until the quota resets at midnight Pacific.
+        Returns the units used today including this call.
+        """
+        while True:
+            quota_day = current_quota_day()
+            used = self._try_reserve(quota_day, cost, command)
+            if used is not None:
+                return used
+
+            if self.policy == 'refuse':
+                raise QuotaExceededError(
+                    f"Daily API quota of {self.daily_limit} units would be exceeded by {command} (cost {cost}). "
+                    f"Quota resets at {next_quota_reset():%Y-%m-%d %H:%M %Z}."
+                )
+            wait = (next_quota_reset() - datetime.now(QUOTA_TIMEZONE)).total_seconds() + 1
+            logger.warning(f"Daily API quota exhausted; deferring {command} for {wait / 3600:.1f} hours until the quota resets.")
+            time.sleep(wait)
+
+    def _try_reserve(self, quota_day, cost, command):
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                used = self._used(quota_day)
+                if used + cost > self.daily_limit:
+                    self.conn.execute('ROLLBACK')
+                    return None
+                self.conn.execute('''
+                    INSERT INTO quota_usage (quota_day, command, units, calls) VALUES (?, ?, ?, 1)
+                    ON CONFLICT (quota_day, command) DO UPDATE SET
+                        units = units + excluded.units,
+                        calls = calls + 1
+                ''', (quota_day, command, cost))
+                self.conn.execute('COMMIT')
+                return used + cost
+            except sqlite3.Error:
+                self.conn.execute('ROLLBACK')
+                raise
+
+    def mark_exhausted(self):
+        """Records the remaining units as spent after the API itself reported quotaExceeded."""
+        with self.lock:
+            quota_day = current_quota_day()
+            self.conn.execute('BEGIN IMMEDIATE')
+            remaining = self.daily_limit - self._used(quota_day)
+            if remaining > 0:
+                self.conn.execute('''
+                    INSERT INTO quota_usage (quota_day, command, units, calls) VALUES (?, 'quotaExceeded', ?, 0)
+                    ON CONFLICT (quota_day, command) DO UPDATE SET units = units + excluded.units
+                ''', (quota_day, remaining))
+            self.conn.execute('COMMIT')
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket; acquire() blocks until a token is available."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        """Changes the refill rate; tokens accrued so far are kept."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.rate = rate
+
+    def acquire(self, tokens=1, stop=None):
+        """
+        Waits for tokens and takes them. With a stop event, the wait ends early once it is set;
+        returns whether the tokens were taken.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if stop is None:
+                time.sleep(wait)
+            elif stop.wait(wait):
+                return False
+
+
+class RequestLimiter:
+    """
+    Shared gate for API requests made from several threads.
+    Bounds the number of requests in flight; pacing their starts is the TokenBucket's job.
+    """
+
+    def __init__(self, max_in_flight=8):
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def __enter__(self):
+        self._slots.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._slots.release()
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ResponseCache:
+    """
+    SQLite-backed store of YouTube Data API responses keyed by request.
+    Entries keep the ETag the API returned so later calls can be made conditional
+    with If-None-Match and answered from the cache on a 304.
+    """
+
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.create_tables()
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS api_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    etag TEXT,
+                    body TEXT,
+                    size INTEGER,
+                    last_used REAL
+                )
+            ''')
+            self.conn.commit()
+
+    @staticmethod
+    def make_key(request):
+        return hashlib.md5(f"{request.method} {request.uri}".encode()).hexdigest()
+
+    def get(self, cache_key):
+        """Returns the cached {'etag', 'response'} for a key, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT etag, body FROM api_responses WHERE cache_key = ?', (cache_key,)
+            ).fetchone()
+            if not row:
+                return None
+            self.conn.execute(
+                'UPDATE api_responses SET last_used = ? WHERE cache_key = ?', (time.time(), cache_key)
+            )
+            self.conn.commit()
+        return {'etag': row[0], 'response': json.loads(row[1])}
+
+    def put(self, cache_key, etag, response):
+        body = json.dumps(response)
+        with self.lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO api_responses (cache_key, etag, body, size, last_used)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (cache_key, etag, body, len(body), time.time()))
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        total = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM api_responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute('SELECT cache_key, size FROM api_responses ORDER BY last_used').fetchall()
+        evicted = []
+        for cache_key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evicted.append((cache_key,))
+            total -= size
+        self.conn.executemany('DELETE FROM api_responses WHERE cache_key = ?', evicted)
+        logger.info(f"Evicted {len(evicted)} cached API responses.")
+
+    def record_hit(self):
+        with self.lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM api_responses'
+            ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute('DELETE FROM api_responses')
+            self.conn.commit()
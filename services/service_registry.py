@@ -0,0 +1,18 @@
+class ServiceRegistry(dict):
+    """
+    Services built on first lookup.
+    Each factory is called with the registry (so it can look up the services it depends on)
+    the first time its name is looked up, and the result is kept for later lookups. Factories
+    import their modules themselves, so a command pays only for the services it uses.
+    """
+
+    def __init__(self, factories):
+        super().__init__()
+        self.factories = factories
+
+    def __missing__(self, name):
+        if name not in self.factories:
+            raise KeyError(name)
+        service = self.factories[name](self)
+        self[name] = service
+        return service
@@ -0,0 +1,140 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncSyncEngine:
+    """
+    Asyncio driver for playlist syncs on top of a YouTubeAPIService.
+    Each API call still goes through the service (quota ledger, ETag cache, request limiter
+    and connection pool) on a thread pool sized to the connection pool; the event loop
+    overlaps the calls instead of waiting on each in turn. A playlist's next playlistItems
+    page is requested while the videos of the current one resolve, and up to `workers`
+    playlists are fetched at once.
+    """
+
+    def __init__(self, service, workers=None):
+        self.service = service
+        self.workers = max(1, workers or service.sync_workers)
+        self.request_workers = service.transport.max_connections
+        self._executor = None
+
+    def run(self, coroutine):
+        """Runs a coroutine of this engine to completion on a new event loop."""
+        loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.request_workers, thread_name_prefix='api')
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+            self._executor.shutdown(cancel_futures=True)
+
+    async def _call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def fetch_playlist_items(self, playlist_id, known_items=None, stale_video_ids=()):
+        """Fetches a playlist like YouTubeAPIService.fetch_playlist_items, with each next page prefetched."""
+        videos = []
+        missing = []
+        items = []
+        pending = []
+        stale_video_ids = set(stale_video_ids)
+        resolving = []
+        next_page = asyncio.ensure_future(self._call(self.service._fetch_playlist_items_page, playlist_id, None))
+        try:
+            while next_page:
+                response = await next_page
+                next_page = None
+                if response.get('nextPageToken'):
+                    next_page = asyncio.ensure_future(
+                        self._call(self.service._fetch_playlist_items_page, playlist_id, response['nextPageToken'])
+                    )
+
+                page = response['items']
+                items.extend(self.service._parse_playlist_item(item) for item in page)
+                if known_items is None:
+                    resolving.append(asyncio.ensure_future(self._call(self.service._resolve_playlist_items, page)))
+                else:
+                    pending.extend(
+                        item for item in page
+                        if item['id'] not in known_items or item['contentDetails']['videoId'] in stale_video_ids
+                    )
+
+            # gather keeps the pages in playlist order
+            for page_videos, page_missing in await asyncio.gather(*resolving):
+                videos.extend(page_videos)
+                missing.extend(page_missing)
+        except BaseException:
+            for future in [next_page, *resolving]:
+                if future:
+                    future.cancel()
+            raise
+
+        if pending:
+            videos, missing = await self._call(self.service._resolve_playlist_items, pending)
+
+        self.service._log_missing_videos(playlist_id, missing)
+        return {'videos': videos, 'items': items, 'missing': missing}
+
+    def sync_playlists(self, db, playlist_ids, incremental=None):
+        """
+        Syncs several playlists like YouTubeAPIService.sync_playlists.
+        The event loop runs on a background thread; each fetched playlist is handed back to
+        the calling thread, which owns the database connection, and stored while the loop
+        goes on fetching the others.
+        """
+        plans = {playlist_id: self.service._plan_playlist_sync(db, playlist_id, incremental) for playlist_id in playlist_ids}
+        finished = queue.Queue()
+        loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=self.request_workers, thread_name_prefix='api')
+        fetch_all = loop.create_task(self._fetch_playlists(plans, finished))
+        thread = threading.Thread(target=self._run_loop, args=(loop, fetch_all, finished), name='playlist-sync', daemon=True)
+        thread.start()
+        try:
+            for _ in plans:
+                playlist_id, fetched, error = finished.get()
+                if playlist_id is None:
+                    raise error
+                if error is not None:
+                    if self.service._is_quota_exceeded(error):
+                        raise error
+                    logger.error(f"Failed to sync playlist {playlist_id}: {error}")
+                    yield {'playlist_id': playlist_id, 'error': error}
+                    continue
+
+                sync_result = self.service.apply_playlist_items(db, playlist_id, fetched)
+                db.update_playlist_last_fetched(playlist_id)
+                yield sync_result
+        finally:
+            loop.call_soon_threadsafe(fetch_all.cancel)
+            thread.join()
+            loop.close()
+            self._executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def _run_loop(loop, task, finished):
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            finished.put((None, None, e))
+
+    async def _fetch_playlists(self, plans, finished):
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def fetch(playlist_id):
+            known_items, stale_video_ids = plans[playlist_id]
+            async with semaphore:
+                try:
+                    fetched = await self.fetch_playlist_items(playlist_id, known_items, stale_video_ids)
+                except Exception as e:
+                    finished.put((playlist_id, None, e))
+                    return
+            finished.put((playlist_id, fetched, None))
+
+        await asyncio.gather(*(fetch(playlist_id) for playlist_id in plans))
@@ -0,0 +1,110 @@
+import os
+import subprocess
+import time
+
+# ffmpeg audio encoder and file extension per target codec (the codecs FFmpegExtractAudio accepts)
+AUDIO_ENCODERS = {
+    'mp3': ('libmp3lame', 'mp3'),
+    'aac': ('aac', 'm4a'),
+    'm4a': ('aac', 'm4a'),
+    'opus': ('libopus', 'opus'),
+    'vorbis': ('libvorbis', 'ogg'),
+    'flac': ('flac', 'flac'),
+    'wav': ('pcm_s16le', 'wav'),
+}
+
+
+class TranscodeError(RuntimeError):
+    pass
+
+
+def children_cpu_seconds():
+    """
+    Returns the CPU seconds (user + system) of every child process this one has reaped so
+    far, yt-dlp's ffmpeg runs included. Only a delta over a whole run is meaningful: workers
+    reap their children concurrently, so it can't be split between items.
+    """
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def run_ffmpeg(args):
+    """
+    Runs ffmpeg with args and returns the CPU seconds (user + system) it used.
+    The CPU time comes from the child's own rusage, so it is exact per call even when
+    several encodes run at once; where wait4 is unavailable it is reported as None.
+    """
+    process = subprocess.Popen(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin', '-y', *args],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    stderr = process.stderr.read()
+    process.stderr.close()
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        cpu_seconds = usage.ru_utime + usage.ru_stime
+    else:
+        process.wait()
+        cpu_seconds = None
+    if process.returncode != 0:
+        raise TranscodeError(stderr.decode(errors='replace').strip() or f"ffmpeg exited with {process.returncode}")
+    return cpu_seconds
+
+
+def transcode_audio(source, codec='mp3', quality='192'):
+    """
+    Converts a downloaded file to an audio-only file in codec, at quality kbps (or VBR
+    level for values up to 10, as FFmpegExtractAudio does), and removes the source.
+    A source already in the target format is kept as is.
+    Returns {'path', 'cpu_seconds', 'seconds'}.
+    """
+    started = time.monotonic()
+    encoder, ext = AUDIO_ENCODERS[codec]
+    dest = os.path.splitext(source)[0] + '.' + ext
+    if dest == source:
+        return {'path': source, 'cpu_seconds': 0.0, 'seconds': 0.0}
+
+    args = ['-i', source, '-vn', '-c:a', encoder]
+    if codec not in ('flac', 'wav'):
+        quality = float(quality)
+        args += ['-q:a', f'{quality:g}'] if quality <= 10 else ['-b:a', f'{quality:g}k']
+    cpu_seconds = run_ffmpeg([*args, dest])
+    os.remove(source)
+    return {'path': dest, 'cpu_seconds': cpu_seconds, 'seconds': time.monotonic() - started}
+
+
+# Native audio containers kept as downloaded (None), or remuxed with a stream copy into the given one
+REMUX_CONTAINERS = {
+    'm4a': None,
+    'opus': None,
+    'ogg': None,
+    'mp3': None,
+    'mp4': 'm4a',
+    'webm': 'opus',
+}
+
+
+def remux_audio(source, codec='mp3', quality='192'):
+    """
+    Keeps a natively downloaded audio stream without re-encoding: native audio containers are
+    kept as is, and audio in a video container is copied into a matching audio container.
+    Streams that cannot be copied fall back to transcode_audio(source, codec, quality).
+    Returns {'path', 'cpu_seconds', 'seconds', 'method'}, method being copy, remux or transcode.
+    """
+    started = time.monotonic()
+    ext = os.path.splitext(source)[1][1:].lower()
+    if ext in REMUX_CONTAINERS and REMUX_CONTAINERS[ext] is None:
+        return {'path': source, 'cpu_seconds': 0.0, 'seconds': 0.0, 'method': 'copy'}
+
+    if REMUX_CONTAINERS.get(ext):
+        dest = os.path.splitext(source)[0] + '.' + REMUX_CONTAINERS[ext]
+        try:
+            cpu_seconds = run_ffmpeg(['-i', source, '-vn', '-c:a', 'copy', dest])
+            os.remove(source)
+            return {'path': dest, 'cpu_seconds': cpu_seconds, 'seconds': time.monotonic() - started, 'method': 'remux'}
+        except TranscodeError:
+            if os.path.exists(dest):
+                os.remove(dest)
+
+    return {**transcode_audio(source, codec, quality), 'method': 'transcode'}
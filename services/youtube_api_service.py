@@ -1,7 +1,8 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 import logging
 import os
 import pickle
+import threading
 
 import time
 import random
@@ -9,7 +10,13 @@ from googleapiclient.errors import HttpError
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+
+from services.http_transport import DEFAULT_MAX_CONNECTIONS, DEFAULT_TIMEOUT, HttpTransport
+from services.quota_ledger import DAILY_QUOTA_LIMIT, QuotaExceededError, QuotaLedger
+from services.rate_limiting import RequestLimiter, TokenBucket
+from services.response_cache import DEFAULT_MAX_BYTES, ResponseCache
+from services.sync_engine import AsyncSyncEngine
+from services.youtube_discovery import build_youtube
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,17 +26,62 @@ QUOTA_COSTS = {
     'search': 100,
     'videos.insert': 1600,
 }
-DAILY_QUOTA_LIMIT = 10000
+VIDEOS_LIST_MAX_IDS = 50  # videos.list accepts at most 50 comma-separated IDs
+PLAYLISTS_LIST_MAX_IDS = 50  # as does playlists.list
+PLAYLISTS_LIST_MAX_RESULTS = 50
+BATCH_MAX_REQUESTS = 50  # sub-requests sent in one multipart batch request
+MAX_RETRIES = 5
+RETRYABLE_STATUSES = (403, 429, 500, 503)
 QUOTA_WARNING_THRESHOLD = 0.8  # Warn at 80% usage
 
 SCOPES = ['https://www.googleapis.com/auth/youtube.force-ssl']
 
+
 class YouTubeAPIService:
-    def __init__(self, client_secrets_file):
+    def __init__(self, client_secrets_file, response_cache=None, incremental_sync=False, stale_after_days=0,
+                 request_limiter=None, sync_workers=1, quota_ledger=None, token_bucket=None,
+                 discovery_document_path=None, transport=None):
         self.client_secrets_file = client_secrets_file
         self.credentials = None
         self.youtube = None
+        self.discovery_document_path = discovery_document_path
+        self._youtube_credentials = None
         self.quota_usage = 0
+        self.quota_ledger = quota_ledger
+        self.token_bucket = token_bucket
+        self.response_cache = response_cache
+        self.incremental_sync = incremental_sync
+        self.stale_after_days = stale_after_days
+        self.request_limiter = request_limiter or RequestLimiter()
+        self.sync_workers = sync_workers
+        self.transport = transport or HttpTransport()
+        self._quota_lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds the service with the optional components enabled in controls.toml."""
+        response_cache = None
+        if config.get('api_cache_path'):
+            max_bytes = int(config.get('api_cache_max_mb', DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+            response_cache = ResponseCache(config['api_cache_path'], max_bytes=max_bytes)
+        token_bucket = None
+        if config.get('requests_per_second'):
+            token_bucket = TokenBucket(config['requests_per_second'], config.get('request_burst'))
+        return cls(
+            config['client_secrets_file'],
+            response_cache=response_cache,
+            incremental_sync=config.get('incremental_sync', False),
+            stale_after_days=config.get('stale_after_days', 0),
+            request_limiter=RequestLimiter(max_in_flight=config.get('max_requests_in_flight', 8)),
+            sync_workers=config.get('sync_workers', 1),
+            quota_ledger=QuotaLedger.from_config(config),
+            token_bucket=token_bucket,
+            discovery_document_path=config.get('discovery_document_path'),
+            transport=HttpTransport(
+                timeout=config.get('http_timeout', DEFAULT_TIMEOUT),
+                max_connections=config.get('http_max_connections', DEFAULT_MAX_CONNECTIONS)
+            )
+        )
 
     def try_load_credentials(self):
         """
@@ -45,13 +97,13 @@ class YouTubeAPIService:
                     self.credentials = None
 
         if self.credentials and self.credentials.valid:
-            self.youtube = build('youtube', 'v3', credentials=self.credentials, cache_discovery=False)
+            self._build_service()
             return True
 
         if self.credentials and self.credentials.expired and self.credentials.refresh_token:
             try:
                 self.credentials.refresh(Request())
-                self.youtube = build('youtube', 'v3', credentials=self.credentials, cache_discovery=False)
+                self._build_service()
                 # Save refreshed token
                 with open('token.pickle', 'wb') as token:
                     pickle.dump(self.credentials, token)
@@ -72,7 +124,14 @@ class YouTubeAPIService:
         with open('token.pickle', 'wb') as token:
             pickle.dump(self.credentials, token)
             
-        self.youtube = build('youtube', 'v3', credentials=self.credentials, cache_discovery=False)
+        self._build_service()
+
+    def _build_service(self):
+        """Builds the API client once per set of credentials, from a local discovery document."""
+        if self.youtube is None or self._youtube_credentials is not self.credentials:
+            self.youtube = build_youtube(self.credentials, self.discovery_document_path)
+            self._youtube_credentials = self.credentials
+        return self.youtube
 
     def get_service(self):
         """Returns the authenticated service, raising an error if not authenticated."""
@@ -84,20 +143,30 @@ class YouTubeAPIService:
     def _execute_request(self, request, cost=1):
         """
         Executes an API request with quota tracking and exponential backoff.
+        When a response cache is configured, the request is made conditional on the
+        cached ETag and a 304 is answered from the cache.
         """
-        # Local Quota Tracking
-        self.quota_usage += cost
-        if self.quota_usage >= DAILY_QUOTA_LIMIT * QUOTA_WARNING_THRESHOLD:
-            logger.warning(f"QUOTA WARNING: Approaching daily limit. Usage: {self.quota_usage}/{DAILY_QUOTA_LIMIT}")
+        self._reserve_quota(request, cost)
+
+        if self.token_bucket:
+            self.token_bucket.acquire()
+
+        cache_key, cached, response_headers = self._prepare_conditional_request(request)
 
         retries = 0
-        max_retries = 5
+        max_retries = MAX_RETRIES
         
         while True:
             try:
-                return request.execute()
+                with self.request_limiter, self.transport.connection(self.credentials) as http:
+                    response = request.execute(http=http)
+                break
             except HttpError as e:
-                if e.resp.status in [403, 429, 500, 503]:
+                if cached and e.resp.status == 304:
+                    self.response_cache.record_hit()
+                    return cached['response']
+
+                if e.resp.status in RETRYABLE_STATUSES:
                     reason = None
                     try:
                         reason = e.content.decode('utf-8')
@@ -106,6 +175,8 @@ class YouTubeAPIService:
                     
                     if e.resp.status == 403 and "quotaExceeded" in str(reason):
                         logger.error("CRITICAL: YouTube API Quota Exceeded for the day.")
+                        if self.quota_ledger:
+                            self.quota_ledger.mark_exhausted()
                         raise e  # Stop immediately, cannot retry
 
                     if retries < max_retries:
@@ -117,7 +188,146 @@ class YouTubeAPIService:
                 
                 raise e  # Re-raise if not retryable or max retries reached
 
+        self._store_response(cache_key, response, response_headers)
+        return response
+
+    def _reserve_quota(self, request, cost):
+        # Quota tracking: the persistent ledger refuses (or defers) calls that would
+        # exceed the daily limit; without one, usage is only counted for this process
+        command = self._quota_command(request)
+        with self._quota_lock:
+            self.quota_usage += cost
+            quota_usage = self.quota_usage
+        daily_limit = DAILY_QUOTA_LIMIT
+        if self.quota_ledger:
+            quota_usage = self.quota_ledger.reserve(cost, command)
+            daily_limit = self.quota_ledger.daily_limit
+        if quota_usage >= daily_limit * QUOTA_WARNING_THRESHOLD:
+            logger.warning(f"QUOTA WARNING: Approaching daily limit. Usage: {quota_usage}/{daily_limit}")
+
+    def _store_response(self, cache_key, response, response_headers):
+        if cache_key:
+            self.response_cache.record_miss()
+            etag = response_headers.get('etag') or response.get('etag')
+            if etag:
+                self.response_cache.put(cache_key, etag, response)
+
+    def _execute_batch(self, requests, cost=1):
+        """
+        Executes independent API requests, sending up to BATCH_MAX_REQUESTS of them in one
+        multipart batch request. Returns each request's response, or the HttpError it failed
+        with, in the order of requests; only a quota exhaustion is raised.
+        Quota, ETag caching and retries with backoff apply to every sub-request as they do to
+        single requests; a single request is sent on its own.
+        """
+        if len(requests) == 1:
+            try:
+                return [self._execute_request(requests[0], cost)]
+            except HttpError as e:
+                if self._is_quota_exceeded(e):
+                    raise
+                return [e]
+
+        results = [None] * len(requests)
+        for start in range(0, len(requests), BATCH_MAX_REQUESTS):
+            chunk = dict(enumerate(requests[start:start + BATCH_MAX_REQUESTS], start))
+            for request in chunk.values():
+                self._reserve_quota(request, cost)
+            self._execute_batch_chunk(chunk, results)
+        return results
+
+    def _execute_batch_chunk(self, chunk, results):
+        prepared = {index: self._prepare_conditional_request(request) for index, request in chunk.items()}
+        pending = list(chunk)
+        retries = 0
+        while pending:
+            if self.token_bucket:
+                self.token_bucket.acquire()
 
+            responses = {}
+            batch = self.get_service().new_batch_http_request(
+                callback=lambda request_id, response, exception: responses.update({int(request_id): (response, exception)})
+            )
+            for index in pending:
+                batch.add(chunk[index], request_id=str(index))
+            try:
+                with self.request_limiter, self.transport.connection(self.credentials) as http:
+                    batch.execute(http=http)
+            except HttpError as e:
+                # The batch request as a whole failed, so none of its sub-requests ran
+                if self._is_quota_exceeded(e):
+                    logger.error("CRITICAL: YouTube API Quota Exceeded for the day.")
+                    if self.quota_ledger:
+                        self.quota_ledger.mark_exhausted()
+                    raise
+                if e.resp.status not in RETRYABLE_STATUSES or retries >= MAX_RETRIES:
+                    raise
+                responses = {}
+
+            retry = []
+            for index in pending:
+                if index not in responses:
+                    retry.append(index)
+                    continue
+                response, exception = responses[index]
+                cache_key, cached, response_headers = prepared[index]
+                if exception is None:
+                    self._store_response(cache_key, response, response_headers)
+                    results[index] = response
+                elif cached and exception.resp.status == 304:
+                    self.response_cache.record_hit()
+                    results[index] = cached['response']
+                elif self._is_quota_exceeded(exception):
+                    logger.error("CRITICAL: YouTube API Quota Exceeded for the day.")
+                    if self.quota_ledger:
+                        self.quota_ledger.mark_exhausted()
+                    raise exception
+                elif exception.resp.status in RETRYABLE_STATUSES and retries < MAX_RETRIES:
+                    retry.append(index)
+                else:
+                    results[index] = exception
+
+            pending = retry
+            if pending:
+                sleep_time = (2 ** retries) + random.uniform(0, 1)
+                logger.warning(f"{len(pending)} batched requests failed transiently. Retrying in {sleep_time:.2f}s...")
+                time.sleep(sleep_time)
+                retries += 1
+
+    @staticmethod
+    def _quota_command(request):
+        """Returns the API method a request calls, e.g. 'videos.list', for per-command quota accounting."""
+        method_id = getattr(request, 'methodId', None) or 'unknown'
+        return method_id.removeprefix('youtube.')
+
+    @staticmethod
+    def _is_quota_exceeded(error):
+        if isinstance(error, QuotaExceededError):
+            return True
+        return isinstance(error, HttpError) and error.resp.status == 403 and b"quotaExceeded" in (error.content or b"")
+
+    def _prepare_conditional_request(self, request):
+        """
+        Adds If-None-Match to a cacheable request and captures the ETag header of its response.
+        Returns the cache key, the cached entry (if any) and the dict the response headers land in.
+        """
+        response_headers = {}
+        if not self.response_cache or request.method != 'GET':
+            return None, None, response_headers
+
+        cache_key = self.response_cache.make_key(request)
+        cached = self.response_cache.get(cache_key)
+        if cached:
+            request.headers['If-None-Match'] = cached['etag']
+
+        postproc = request.postproc
+
+        def capture_headers(resp, content):
+            response_headers.update(resp)
+            return postproc(resp, content)
+
+        request.postproc = capture_headers
+        return cache_key, cached, response_headers
 
     def get_playlist_details(self, playlist_id):
         request = self.get_service().playlists().list(
@@ -127,40 +337,126 @@ class YouTubeAPIService:
         response = self._execute_request(request, cost=QUOTA_COSTS['list'])
 
         if 'items' in response and len(response['items']) > 0:
-            playlist = response['items'][0]
-            return {
-                'id': playlist['id'],
-                'title': playlist['snippet']['title'],
-                'description': playlist['snippet']['description'],
-                'channel_id': playlist['snippet']['channelId'],
-                'channel_title': playlist['snippet']['channelTitle'],
-                'item_count': playlist['contentDetails']['itemCount']
-            }
+            return self._parse_playlist(response['items'][0])
         return None
 
+    def get_playlists_details(self, playlist_ids):
+        """
+        Fetches details for many playlists using playlists.list calls of up to 50 IDs each,
+        sent together in batch requests. Returns {playlist_id: details}, without the playlists
+        the API did not return; playlists whose call failed are logged and left out.
+        """
+        unique_ids = list(dict.fromkeys(playlist_ids))
+        chunks = [unique_ids[i:i + PLAYLISTS_LIST_MAX_IDS] for i in range(0, len(unique_ids), PLAYLISTS_LIST_MAX_IDS)]
+        requests = [
+            self.get_service().playlists().list(part="snippet,contentDetails", id=','.join(chunk))
+            for chunk in chunks
+        ]
+        details = {}
+        for chunk, response in zip(chunks, self._execute_batch(requests, cost=QUOTA_COSTS['list'])):
+            if isinstance(response, HttpError):
+                logger.error(f"Failed to fetch details of {len(chunk)} playlists: {response}")
+                continue
+            for playlist in response.get('items', []):
+                details[playlist['id']] = self._parse_playlist(playlist)
+        return details
+
+    @staticmethod
+    def _parse_playlist(playlist):
+        return {
+            'id': playlist['id'],
+            'title': playlist['snippet']['title'],
+            'description': playlist['snippet']['description'],
+            'channel_id': playlist['snippet']['channelId'],
+            'channel_title': playlist['snippet']['channelTitle'],
+            'item_count': playlist['contentDetails']['itemCount']
+        }
+
     def get_playlist_items(self, playlist_id):
-        items = []
-        next_page_token = None
+        return self.fetch_playlist_items(playlist_id)['videos']
 
-        while True:
-            request = self.get_service().playlistItems().list(
-                part="snippet,contentDetails",
-                playlistId=playlist_id,
-                maxResults=50,
-                pageToken=next_page_token
-            )
-            response = self._execute_request(request, cost=QUOTA_COSTS['list'])
+    def fetch_playlist_items(self, playlist_id, known_items=None, stale_video_ids=()):
+        """
+        Walks a playlist once and resolves its videos with batched videos.list calls.
+        When known_items (the stored {playlist_item_id: (video_id, position)}) is given,
+        only items new to the playlist and the stale_video_ids are resolved.
+        Returns the resolved videos in playlist order, the current playlist items and
+        the items that could not be resolved.
+        Runs on the async sync engine, which prefetches each next page while the current
+        page's videos resolve.
+        """
+        engine = AsyncSyncEngine(self)
+        return engine.run(engine.fetch_playlist_items(playlist_id, known_items, stale_video_ids))
 
-            for item in response['items']:
-                video_id = item['contentDetails']['videoId']
-                video_details = self.get_video_details(video_id)
-                items.append(video_details)
+    @staticmethod
+    def _parse_playlist_item(item):
+        return {
+            'id': item['id'],
+            'video_id': item['contentDetails']['videoId'],
+            'position': item['snippet'].get('position')
+        }
 
-            next_page_token = response.get('nextPageToken')
-            if not next_page_token:
-                break
+    def _fetch_playlist_items_page(self, playlist_id, page_token=None):
+        """Returns one playlistItems.list page; its 'nextPageToken' leads to the next."""
+        request = self.get_service().playlistItems().list(
+            part="snippet,contentDetails,status",
+            playlistId=playlist_id,
+            maxResults=50,
+            pageToken=page_token
+        )
+        return self._execute_request(request, cost=QUOTA_COSTS['list'])
 
-        return items
+    def _resolve_playlist_items(self, page):
+        """
+        Resolves the videos of raw playlistItems entries with batched videos.list calls.
+        Returns the video details in playlist order and the items that could not be resolved.
+        """
+        video_ids = [item['contentDetails']['videoId'] for item in page]
+        videos, missing_ids = self.get_videos_details(video_ids)
+        missing_ids = set(missing_ids)
+        missing = [
+            {
+                'id': item['contentDetails']['videoId'],
+                'position': item['snippet'].get('position'),
+                'reason': self._missing_reason(item)
+            }
+            for item in page if item['contentDetails']['videoId'] in missing_ids
+        ]
+        return videos, missing
+
+    @staticmethod
+    def _missing_reason(item):
+        if item.get('status', {}).get('privacyStatus') == 'private' or item['snippet'].get('title') == 'Private video':
+            return 'private'
+        if item['snippet'].get('title') == 'Deleted video':
+            return 'deleted'
+        return 'unavailable'
+
+    @staticmethod
+    def _log_missing_videos(playlist_id, missing):
+        for video in missing:
+            logger.warning(f"Video {video['id']} in playlist {playlist_id} is {video['reason']} and was skipped.")
+
+    def get_videos_details(self, video_ids):
+        """
+        Fetches details for many videos using videos.list calls of up to 50 IDs each.
+        Returns the details in the order of video_ids and the IDs the API did not return.
+        """
+        found = {}
+        unique_ids = list(dict.fromkeys(video_ids))
+        for i in range(0, len(unique_ids), VIDEOS_LIST_MAX_IDS):
+            chunk = unique_ids[i:i + VIDEOS_LIST_MAX_IDS]
+            request = self.get_service().videos().list(
+                part="snippet,contentDetails,statistics",
+                id=','.join(chunk)
+            )
+            response = self._execute_request(request, cost=QUOTA_COSTS['list'])
+            for video in response.get('items', []):
+                found[video['id']] = self._parse_video(video)
+
+        videos = [found[video_id] for video_id in video_ids if video_id in found]
+        missing = [video_id for video_id in unique_ids if video_id not in found]
+        return videos, missing
 
     def get_video_details(self, video_id):
         request = self.get_service().videos().list(
@@ -170,27 +466,30 @@ class YouTubeAPIService:
         response = self._execute_request(request, cost=QUOTA_COSTS['list'])
 
         if 'items' in response and len(response['items']) > 0:
-            video = response['items'][0]
-            return {
-                'id': video['id'],
-                'title': video['snippet']['title'],
-                'description': video['snippet']['description'],
-                'published_at': datetime.strptime(video['snippet']['publishedAt'], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc),
-                'channel_id': video['snippet']['channelId'],
-                'channel_title': video['snippet']['channelTitle'],
-                'view_count': int(video['statistics'].get('viewCount', 0)),
-                'like_count': int(video['statistics'].get('likeCount', 0)),
-                'comment_count': int(video['statistics'].get('commentCount', 0)),
-                'duration': video['contentDetails']['duration']
-            }
+            return self._parse_video(response['items'][0])
         return None
 
+    @staticmethod
+    def _parse_video(video):
+        return {
+            'id': video['id'],
+            'title': video['snippet']['title'],
+            'description': video['snippet']['description'],
+            'published_at': datetime.strptime(video['snippet']['publishedAt'], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc),
+            'channel_id': video['snippet']['channelId'],
+            'channel_title': video['snippet']['channelTitle'],
+            'view_count': int(video['statistics'].get('viewCount', 0)),
+            'like_count': int(video['statistics'].get('likeCount', 0)),
+            'comment_count': int(video['statistics'].get('commentCount', 0)),
+            'duration': video['contentDetails']['duration']
+        }
+
     def get_playlists(self):
         items = []
         request = self.get_service().playlists().list(
-            part="snippet",
+            part="snippet,contentDetails",
             mine=True,
-            maxResults=50
+            maxResults=PLAYLISTS_LIST_MAX_RESULTS
         )
         while request:
             response = self._execute_request(request, cost=QUOTA_COSTS['list'])
@@ -198,44 +497,79 @@ class YouTubeAPIService:
             request = self.get_service().playlists().list_next(request, response)
         return items
 
-    def update_playlist(self, db, playlist_id):
-        playlist_details = self.get_playlist_details(playlist_id)
+    def update_playlist(self, db, playlist_id, playlist_details=None):
+        playlist_details = playlist_details or self.get_playlist_details(playlist_id)
         if playlist_details:
-            old_hash = db.get_playlist_hash(playlist_id)
-            new_hash = db.update_playlist(
-                playlist_id,
-                playlist_details['title'],
-                playlist_details['description'],
-                playlist_details['channel_id'],
-                playlist_details['channel_title'],
-                playlist_details['item_count']
-            )
-            return new_hash != old_hash
+            result = db.upsert_playlists([playlist_details])
+            return playlist_id not in result['unchanged']
         return False
 
-    def update_playlist_items(self, db, playlist_id):
-        playlist_items = self.get_playlist_items(playlist_id)
-        updated_videos = []
-        for item in playlist_items:
-            if item is None:  # Skip if item is None
-                continue
-            old_hash = db.get_video_hash(item['id'])
-            new_hash = db.update_video(
-                item['id'],
-                playlist_id,
-                item['title'],
-                item['description'],
-                item['published_at'],
-                item['channel_id'],
-                item['channel_title'],
-                item['view_count'],
-                item['like_count'],
-                item['comment_count'],
-                item['duration']
-            )
-            if new_hash != old_hash:
-                updated_videos.append(item['id'])
-        return updated_videos
+    def update_playlists(self, db, playlist_ids, playlists=()):
+        """
+        Refreshes the metadata of several playlists and stores it with one bulk upsert.
+        Playlist items already listed (e.g. by get_playlists) are used as they are; the rest
+        are fetched with batched lookups. Returns the IDs of playlists whose metadata changed.
+        """
+        listed = {playlist['id']: self._parse_playlist(playlist) for playlist in playlists}
+        details = {playlist_id: listed[playlist_id] for playlist_id in playlist_ids if playlist_id in listed}
+        details.update(self.get_playlists_details([playlist_id for playlist_id in playlist_ids if playlist_id not in listed]))
+        result = db.upsert_playlists(list(details.values()))
+        return set(result['inserted'] + result['updated'])
+
+    def update_playlist_items(self, db, playlist_id, incremental=None):
+        return self.sync_playlist_items(db, playlist_id, incremental)['updated']
+
+    def sync_playlist_items(self, db, playlist_id, incremental=None):
+        """
+        Fetches a playlist's videos in a single traversal and stores them.
+        In incremental mode only items added since the last sync, plus videos last
+        resolved more than stale_after_days ago, are looked up with videos.list.
+        Returns a sync result holding the fetched videos, the IDs of videos whose
+        content changed, the added and removed video IDs and the playlist items
+        that could not be resolved.
+        """
+        known_items, stale_video_ids = self._plan_playlist_sync(db, playlist_id, incremental)
+        fetched = self.fetch_playlist_items(playlist_id, known_items, stale_video_ids)
+        return self.apply_playlist_items(db, playlist_id, fetched)
+
+    def _plan_playlist_sync(self, db, playlist_id, incremental=None):
+        """Reads what an incremental sync needs from the database: the stored items and the stale video IDs."""
+        if incremental is None:
+            incremental = self.incremental_sync
+
+        known_items = None
+        stale_video_ids = ()
+        if incremental:
+            known_items = db.get_playlist_items(playlist_id)
+            if self.stale_after_days:
+                older_than = datetime.now() - timedelta(days=self.stale_after_days)
+                stale_video_ids = db.get_stale_playlist_video_ids(playlist_id, older_than)
+        return known_items, stale_video_ids
+
+    def sync_playlists(self, db, playlist_ids, workers=None, incremental=None):
+        """
+        Syncs the items of several playlists, fetching up to `workers` of them concurrently
+        on the async sync engine. Only the engine talks to the API (through the shared request
+        limiter); all database reads and writes happen on the calling thread.
+        Yields one sync result per playlist as it finishes, or a result with 'error'
+        set if the playlist could not be fetched.
+        """
+        return AsyncSyncEngine(self, workers).sync_playlists(db, playlist_ids, incremental)
+
+    def apply_playlist_items(self, db, playlist_id, fetched):
+        upsert = db.upsert_videos(playlist_id, fetched['videos'])
+        updated_videos = upsert['inserted'] + upsert['updated']
+
+        resolved_ids = {item['id'] for item in fetched['videos']}
+        membership = db.save_playlist_items(playlist_id, fetched['items'], resolved_ids)
+        return {
+            'playlist_id': playlist_id,
+            'videos': fetched['videos'],
+            'updated': updated_videos,
+            'added': membership['added'],
+            'removed': membership['removed'],
+            'missing': fetched['missing']
+        }
 
     def get_playlist_delta(self, db):
         # Get all playlists the user has access to
@@ -245,17 +579,22 @@ class YouTubeAPIService:
         )
         channels_response = self._execute_request(channels_request, cost=QUOTA_COSTS['list'])
 
+        # Page through every channel's playlists at once, batching one page of each channel per round
         all_playlists = []
-        for channel in channels_response['items']:
-            playlists_request = self.get_service().playlists().list(
-                part="snippet",
-                channelId=channel['id'],
-                maxResults=200
-            )
-            while playlists_request:
-                playlists_response = self._execute_request(playlists_request, cost=QUOTA_COSTS['list'])
-                all_playlists.extend(playlists_response['items'])
-                playlists_request = self.get_service().playlists().list_next(playlists_request, playlists_response)
+        requests = [
+            self.get_service().playlists().list(part="snippet", channelId=channel['id'], maxResults=PLAYLISTS_LIST_MAX_RESULTS)
+            for channel in channels_response['items']
+        ]
+        while requests:
+            next_requests = []
+            for request, response in zip(requests, self._execute_batch(requests, cost=QUOTA_COSTS['list'])):
+                if isinstance(response, HttpError):
+                    raise response
+                all_playlists.extend(response['items'])
+                next_request = self.get_service().playlists().list_next(request, response)
+                if next_request:
+                    next_requests.append(next_request)
+            requests = next_requests
 
         # Get all playlists in the database
         db_playlists = db.get_all_playlists()
@@ -282,29 +621,27 @@ class YouTubeAPIService:
             'unprocessed': unprocessed_playlists
         }
 
-    def get_all_playlist_video_details(self, db, playlist_id):
+    def get_all_playlist_video_details(self, db, playlist_id, playlist_details=None):
+        """
+        Updates a playlist and its videos in the database with a single traversal.
+        Returns the sync result from sync_playlist_items.
+        """
         # Update the playlist in the database
-        playlist_updated = self.update_playlist(db, playlist_id)
+        playlist_updated = self.update_playlist(db, playlist_id, playlist_details)
         if playlist_updated:
             logger.info(f"Playlist {playlist_id} metadata has been updated.")
         else:
             logger.info(f"No changes detected in playlist {playlist_id} metadata.")
 
-        # Update playlist items and get video details
-        updated_videos = self.update_playlist_items(db, playlist_id)
-        if updated_videos:
-            logger.info(f"Updated {len(updated_videos)} videos in playlist {playlist_id}.")
+        # Update playlist items, keeping the fetched video details; stashing needs
+        # every video, so this is always a full sync
+        sync_result = self.sync_playlist_items(db, playlist_id, incremental=False)
+        if sync_result['updated']:
+            logger.info(f"Updated {len(sync_result['updated'])} videos in playlist {playlist_id}.")
         else:
             logger.info(f"No changes detected in videos for playlist {playlist_id}.")
 
-        # Get all video details
-        videos = []
-        playlist_items = self.get_playlist_items(playlist_id)
-        for item in playlist_items:
-            if item is not None:
-                videos.append(item)
-
         # Update the last_fetched timestamp for the playlist
         db.update_playlist_last_fetched(playlist_id)
 
-        return videos
+        return sync_result
@@ -0,0 +1,72 @@
+from functools import lru_cache
+import json
+import logging
+import os
+
+import httplib2
+from googleapiclient.discovery import build, build_from_document
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_URL = 'https://youtube.googleapis.com/$discovery/rest?version=v3'
+DISCOVERY_TIMEOUT = 30
+
+
+class DiscoveryError(RuntimeError):
+    pass
+
+
+@lru_cache(maxsize=4)
+def _parse_document(path, mtime_ns):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_discovery_document(path):
+    """
+    Returns the parsed discovery document saved at path, or None if there is none (or it is
+    unreadable). Parsed documents are kept in memory until the file changes.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return _parse_document(path, os.stat(path).st_mtime_ns)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable discovery document {path}: {e}")
+        return None
+
+
+def build_youtube(credentials, document_path=None):
+    """
+    Builds the YouTube Data API client from the discovery document saved at document_path,
+    or else from the copy bundled with google-api-python-client; neither needs the network.
+    """
+    document = load_discovery_document(document_path)
+    if document is not None:
+        return build_from_document(document, credentials=credentials)
+    return build('youtube', 'v3', credentials=credentials, cache_discovery=False, static_discovery=True)
+
+
+def refresh_discovery_document(path, timeout=DISCOVERY_TIMEOUT):
+    """
+    Downloads the current discovery document and saves it to path, replacing the old copy
+    only once the new one has been validated. Returns {'revision', 'bytes'}.
+    """
+    try:
+        response, content = httplib2.Http(timeout=timeout).request(DISCOVERY_URL)
+    except (httplib2.HttpLib2Error, OSError) as e:
+        raise DiscoveryError(f"Fetching the discovery document failed: {e}")
+    if response.status != 200:
+        raise DiscoveryError(f"Fetching the discovery document failed with HTTP {response.status}")
+    try:
+        document = json.loads(content)
+    except ValueError as e:
+        raise DiscoveryError(f"The discovery document is not valid JSON: {e}")
+    if document.get('name') != 'youtube' or 'resources' not in document:
+        raise DiscoveryError("The fetched document is not the YouTube Data API discovery document")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return {'revision': document.get('revision'), 'bytes': len(content)}
@@ -1,10 +1,30 @@
-import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 import os
+import threading
+import time
 
 import yt_dlp
 
+from services.adaptive_throttle import DEFAULT_DOWNLOADS_PER_HOUR, AdaptiveThrottle, is_throttling_error
+from services.content_store import ContentStore
+from services.download_scheduler import DownloadScheduler
+from services.file_hashing import hash_file
+from services.info_cache import DEFAULT_TTL_SECONDS, InfoCache
+from services.transcoding import TranscodeError, remux_audio, transcode_audio
+
+AUDIO_CODEC = 'mp3'
+AUDIO_QUALITY = '192'
+# 'transcode' re-encodes audio to AUDIO_CODEC; 'remux' keeps the native m4a/opus stream
+# and only re-encodes streams that no audio container can hold as they are
+AUDIO_MODES = ('transcode', 'remux')
+REMUX_AUDIO_FORMAT = 'bestaudio[ext=m4a]/bestaudio[acodec=opus]/bestaudio/best'
+# Extractions ahead of downloading (--plan-only) are cheaper than downloads but still hit YouTube
+DEFAULT_RESOLVES_PER_HOUR = 600
+
 class YTDLPService:
-    def __init__(self):
+    def __init__(self, download_workers=1, downloads_per_hour=None, hash_workers=1, content_store=False, transcode_workers=0, audio_mode='transcode', info_cache=None,
+                 adaptive_pacing=False, max_downloads_per_hour=3600, resolves_per_hour=DEFAULT_RESOLVES_PER_HOUR):
         self.ydl_opts = {
             'format': 'bestaudio/best',
             'postprocessors': [{
@@ -13,6 +33,42 @@ class YTDLPService:
                 'preferredquality': '192',
             }],
         }
+        self.download_workers = download_workers
+        self.downloads_per_hour = downloads_per_hour
+        self.hash_workers = hash_workers
+        self.content_store = content_store
+        # With transcode workers, audio is downloaded in its native format and converted on a
+        # separate pool, instead of by yt-dlp's postprocessor inside the download slot
+        self.transcode_workers = transcode_workers
+        if audio_mode not in AUDIO_MODES:
+            raise ValueError(f"Unknown audio mode: {audio_mode}")
+        self.audio_mode = audio_mode
+        self.info_cache = info_cache
+        self.adaptive_pacing = adaptive_pacing
+        self.max_downloads_per_hour = max_downloads_per_hour
+        self.resolves_per_hour = resolves_per_hour
+        self._local = threading.local()
+        self._open_lock = threading.Lock()
+        self._open_instances = []
+
+    @classmethod
+    def from_config(cls, config):
+        info_cache = None
+        if config.get('info_cache_path'):
+            ttl_hours = config.get('info_cache_ttl_hours', DEFAULT_TTL_SECONDS / 3600)
+            info_cache = InfoCache(config['info_cache_path'], ttl_seconds=ttl_hours * 3600)
+        return cls(
+            download_workers=config.get('download_workers', 1),
+            downloads_per_hour=config.get('downloads_per_hour'),
+            hash_workers=config.get('hash_workers', 1),
+            content_store=config.get('content_store', False),
+            transcode_workers=config.get('transcode_workers', 0),
+            audio_mode=config.get('audio_mode', 'transcode'),
+            info_cache=info_cache,
+            adaptive_pacing=config.get('adaptive_pacing', False),
+            max_downloads_per_hour=config.get('max_downloads_per_hour', 3600),
+            resolves_per_hour=config.get('resolves_per_hour', DEFAULT_RESOLVES_PER_HOUR)
+        )
 
     def download_audio(self, video_url, output_path):
         ydl_opts = {**self.ydl_opts, 'outtmpl': f'{output_path}/%(title)s.%(ext)s'}
@@ -25,50 +81,362 @@ class YTDLPService:
             ydl.download([video_url])
 
     def calculate_file_hash(self, file_path):
-        hash_md5 = hashlib.md5()
-        with open(os.path.normpath(file_path), "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
-
-    def download_videos(self, video_ids, output_path, audio_only=False, db=None):
-        if audio_only:
-            self.ydl_opts['format'] = 'bestaudio/best'
-            self.ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }]
+        return hash_file(file_path)['md5']
+
+    def _build_opts(self, output_path, audio_only, audio_mode=None):
+        """Returns the yt-dlp options for a download; built per call so concurrent downloads don't share state."""
+        # Audio is downloaded natively and converted by our own ffmpeg run (see _download_one
+        # and _transcode_result), so each item's conversion CPU is measured exactly
+        if audio_only and (audio_mode or self.audio_mode) == 'remux':
+            ydl_opts = {'format': REMUX_AUDIO_FORMAT, 'postprocessors': []}
+        elif audio_only:
+            ydl_opts = {'format': 'bestaudio/best', 'postprocessors': []}
         else:
-            self.ydl_opts['format'] = 'bestvideo+bestaudio/best'
-            self.ydl_opts['postprocessors'] = []
+            ydl_opts = {'format': 'bestvideo+bestaudio/best', 'postprocessors': []}
+        ydl_opts['outtmpl'] = os.path.join(output_path, '%(title)s.%(ext)s')
+        return ydl_opts
+
+    @staticmethod
+    def video_url(video_id):
+        return f'https://www.youtube.com/watch?v={video_id}'
+
+    def download_videos(self, video_ids, output_path, audio_only=False, db=None, audio_mode=None):
+        """
+        Downloads several videos with one YoutubeDL instance, so extractor and cookie
+        state are set up once for the whole list.
+        Each file is transcoded (in pipelined mode) and hashed in the background while the
+        next video downloads.
+        Returns a result dict per video: video_id, status, path, file_hash, file_blake2b,
+        bytes, elapsed, hash_seconds, transcode_seconds, cpu_seconds (of the file's own
+        audio conversion) and audio_method.
+        Successful downloads are recorded in db, when given, with one bulk write.
+        """
+        results = []
+        finishing = []
+        with yt_dlp.YoutubeDL(self._build_opts(output_path, audio_only, audio_mode)) as ydl, \
+                ThreadPoolExecutor(max_workers=self.hash_workers) as hasher, \
+                self._transcode_pool(audio_only) as transcoder:
+            finish = self._finisher(hasher, transcoder, audio_mode=audio_mode)
+            for video_id in video_ids:
+                result = self._download_one(ydl, video_id, audio_only, audio_mode)
+                results.append(result)
+                future = finish(result)
+                if future is not None:
+                    finishing.append(future)
+            for future in finishing:
+                future.result()
+
+        if db:
+            db.add_downloads([
+                (result['video_id'], result['path'], result['file_hash'], result['file_blake2b'])
+                for result in results if result['status'] == 'downloaded'
+            ])
+        return results
+
+    def _thread_ydl(self, output_path, audio_only, audio_mode=None):
+        """
+        Returns the calling thread's YoutubeDL for these options, creating it on first use.
+        Worker threads keep theirs for the whole run instead of building one per video.
+        """
+        instances = getattr(self._local, 'instances', None)
+        if instances is None:
+            instances = self._local.instances = {}
+        key = (output_path, audio_only, audio_mode)
+        if key not in instances:
+            instances[key] = yt_dlp.YoutubeDL(self._build_opts(output_path, audio_only, audio_mode))
+            with self._open_lock:
+                self._open_instances.append(instances[key])
+        return instances[key]
+
+    def _close_thread_ydls(self):
+        """Closes every per-thread YoutubeDL, saving their cookies, once a run is over."""
+        with self._open_lock:
+            for ydl in self._open_instances:
+                ydl.close()
+            self._open_instances.clear()
+            self._local = threading.local()
+
+    def download_video_id(self, video_id, output_path, audio_only=False, audio_mode=None):
+        """Downloads one video with the calling thread's reusable YoutubeDL and returns its result dict."""
+        return self._download_one(self._thread_ydl(output_path, audio_only, audio_mode), video_id, audio_only, audio_mode)
+
+    def _download_one(self, ydl, video_id, audio_only, audio_mode=None):
+        started = time.monotonic()
+        result = self._download_result(ydl, video_id, audio_only)
+        result['elapsed'] = time.monotonic() - started
+        if audio_only and not self.transcode_workers and result['status'] == 'downloaded':
+            # Without a transcode pool, audio is converted here, in the download slot
+            result = self._transcode_result(result, audio_mode)
+        return result
+
+    def _download_result(self, ydl, video_id, audio_only):
+        result = {
+            'video_id': video_id, 'status': None, 'path': None, 'file_hash': None,
+            'file_blake2b': None, 'bytes': None, 'hash_seconds': None,
+            'transcode_seconds': None, 'cpu_seconds': None, 'audio_method': None, 'throttled': False, 'error': None
+        }
+        try:
+            print(f"Downloading video {video_id}...")
+            info = self._extract_and_download(ydl, video_id)
+            filename = ydl.prepare_filename(info)
+            file_path = os.path.normpath(os.path.join(filename))
+            # Path of the final file after postprocessing, when yt-dlp reports it
+            requested = info.get('requested_downloads') or [{}]
+            processed_path = requested[-1].get('filepath')
+
+            # Check for both original and converted file
+            if processed_path and os.path.exists(processed_path):
+                final_file_path = os.path.normpath(processed_path)
+            elif os.path.exists(file_path):
+                final_file_path = file_path
+            elif audio_only and os.path.exists(os.path.splitext(file_path)[0] + '.mp3'):
+                final_file_path = os.path.splitext(file_path)[0] + '.mp3'
+            else:
+                print(f"File not found after download: {file_path}")
+                result['status'] = 'file_not_found'
+                result['error'] = f"File not found after download: {file_path}"
+                return result
+
+            result['path'] = final_file_path
+            result['bytes'] = os.path.getsize(final_file_path)
+            result['status'] = 'downloaded'
+        except yt_dlp.utils.DownloadError as e:
+            print(f"yt-dlp download error for video {video_id}: {str(e)}")
+            result['status'] = 'download_error'
+            result['error'] = str(e)
+            result['throttled'] = is_throttling_error(str(e))
+        except Exception as e:
+            print(f"Unexpected error downloading video {video_id}: {str(e)}")
+            result['status'] = 'unexpected_error'
+            result['error'] = str(e)
+        return result
 
-        self.ydl_opts['outtmpl'] = os.path.join(output_path, '%(title)s.%(ext)s')
+    def _extract_info(self, ydl, video_id, refresh=False):
+        """
+        Returns the video's info dict with formats chosen for ydl's options, from the info cache
+        when it holds a fresh entry, and whether it came from the cache.
+        """
+        format_spec = ydl.params.get('format')
+        if not refresh:
+            info = self.info_cache.get(video_id, format_spec)
+            if info:
+                return info, True
+        info = ydl.sanitize_info(ydl.extract_info(self.video_url(video_id), download=False))
+        self.info_cache.put(video_id, format_spec, info)
+        return info, False
 
-        with yt_dlp.YoutubeDL(self.ydl_opts) as ydl:
+    def _extract_and_download(self, ydl, video_id):
+        """
+        Downloads a video and returns its processed info dict. With an info cache, extraction is
+        skipped for cached videos; a cached entry that fails to download (e.g. its format URLs
+        expired early) is refreshed and the download retried once.
+        """
+        if not self.info_cache:
+            return ydl.extract_info(self.video_url(video_id), download=True)
+        info, cached = self._extract_info(ydl, video_id)
+        try:
+            return ydl.process_ie_result(info, download=True)
+        except yt_dlp.utils.DownloadError:
+            if not cached:
+                raise
+            print(f"Cached info for video {video_id} failed to download; extracting it again...")
+            info, _ = self._extract_info(ydl, video_id, refresh=True)
+            return ydl.process_ie_result(info, download=True)
+
+    def resolve_many(self, video_ids, output_path, audio_only=False, audio_mode=None, workers=None, throttle=None):
+        """
+        Runs extraction for videos in parallel without downloading, filling the info cache.
+        Extractions start at no more than resolves_per_hour, at most `workers` at a time.
+        A throttling error stops resolution, leaving the remaining videos
+        to be extracted as they download, and is recorded on throttle (the download pacing's
+        AdaptiveThrottle), when given.
+        Yields {'video_id', 'status' ('resolved', 'cached' or 'unavailable'), 'title',
+        'format', 'filesize', 'throttled', 'error'} on the calling thread as each finishes.
+        """
+        if not self.info_cache:
+            raise ValueError("Resolving videos ahead of downloading needs info_cache_path in controls.toml")
+        workers = workers or self.download_workers
+        scheduler = DownloadScheduler(
+            workers=workers, downloads_per_hour=self.resolves_per_hour, burst=workers
+        )
+        throttled = False
+
+        def jobs():
             for video_id in video_ids:
-                try:
-                    print(f"Downloading video {video_id}...")
-                    info = ydl.extract_info(f'https://www.youtube.com/watch?v={video_id}', download=True)
-                    filename = ydl.prepare_filename(info)
-                    file_path = os.path.normpath(os.path.join(filename))
-                    
-                    # Check for both original and converted file
-                    if os.path.exists(file_path):
-                        final_file_path = file_path
-                    elif audio_only and os.path.exists(os.path.splitext(file_path)[0] + '.mp3'):
-                        final_file_path = os.path.splitext(file_path)[0] + '.mp3'
-                    else:
-                        print(f"File not found after download: {file_path}")
-                        return 'file_not_found'
-                    
-                    file_hash = self.calculate_file_hash(final_file_path)
-                    if db:
-                        db.add_download(video_id, final_file_path, file_hash)
-                    return 'downloaded'
-                except yt_dlp.utils.DownloadError as e:
-                    print(f"yt-dlp download error for video {video_id}: {str(e)}")
-                    return 'download_error'
-                except Exception as e:
-                    print(f"Unexpected error downloading video {video_id}: {str(e)}")
-                    return 'unexpected_error'
\ No newline at end of file
+                if throttled:
+                    return
+                yield {'video_id': video_id}
+
+        def resolve(job):
+            video_id = job['video_id']
+            result = {'video_id': video_id, 'status': None, 'title': None, 'format': None, 'filesize': None, 'throttled': False, 'error': None}
+            try:
+                info, cached = self._extract_info(self._thread_ydl(output_path, audio_only, audio_mode), video_id)
+            except Exception as e:
+                result['status'] = 'unavailable'
+                result['error'] = str(e)
+                result['throttled'] = is_throttling_error(str(e))
+                return result
+            result['status'] = 'cached' if cached else 'resolved'
+            result['title'] = info.get('title')
+            result['format'] = info.get('format')
+            result['filesize'] = info.get('filesize') or info.get('filesize_approx')
+            return result
+
+        try:
+            for result in scheduler.run(jobs(), resolve, total=len(video_ids)):
+                if result['throttled']:
+                    throttled = True
+                    if throttle:
+                        throttle.record_throttle()
+                yield result
+        finally:
+            self._close_thread_ydls()
+
+    def _hash_result(self, result):
+        """Fills in the digests of a downloaded file; runs on a hashing thread."""
+        try:
+            digests = hash_file(result['path'])
+        except OSError as e:
+            print(f"Could not hash {result['path']} for video {result['video_id']}: {str(e)}")
+            result['status'] = 'unexpected_error'
+            result['error'] = str(e)
+            return result
+        result['file_hash'] = digests['md5']
+        result['file_blake2b'] = digests['blake2b']
+        result['bytes'] = digests['bytes']
+        result['hash_seconds'] = digests['seconds']
+        return result
+
+    def _transcode_result(self, result, audio_mode=None):
+        """
+        Converts a natively downloaded audio file to the configured codec, or in remux mode
+        keeps its stream and only converts when it must; runs on a transcode thread, or in the
+        download slot when there is no transcode pool.
+        """
+        convert = remux_audio if (audio_mode or self.audio_mode) == 'remux' else transcode_audio
+        try:
+            transcoded = convert(result['path'], AUDIO_CODEC, AUDIO_QUALITY)
+        except (TranscodeError, OSError) as e:
+            print(f"Transcoding failed for video {result['video_id']}: {str(e)}")
+            result['status'] = 'transcode_error'
+            result['error'] = str(e)
+            return result
+        result['path'] = transcoded['path']
+        result['transcode_seconds'] = transcoded['seconds']
+        # Exact for this item: the rusage of the ffmpeg process run for it. yt-dlp's own
+        # ffmpeg runs (video merges) can't be told apart per item; they only count towards
+        # the job's total.
+        result['cpu_seconds'] = transcoded['cpu_seconds']
+        result['audio_method'] = transcoded.get('method', 'transcode')
+        return result
+
+    def _transcode_pool(self, audio_only):
+        """
+        Returns the bounded pool for pipelined transcoding, or a null context when audio is
+        converted inline. Threads suffice: each conversion runs in its own ffmpeg process.
+        """
+        if audio_only and self.transcode_workers:
+            return ThreadPoolExecutor(max_workers=self.transcode_workers)
+        return nullcontext(None)
+
+    def _finisher(self, hasher, transcoder, content_store=None, audio_mode=None):
+        """
+        Returns the finish stage for downloads: transcode (when a transcoder is given), then
+        hash and add to the content store, off the download workers. finish(result) returns a
+        future resolving to the finished result, or None for failed downloads.
+        """
+        def hash_and_store(result):
+            result = self._hash_result(result)
+            return self._store_result(result, content_store) if content_store else result
+
+        def finish(result):
+            if result['status'] != 'downloaded':
+                return None
+            if transcoder is None:
+                return hasher.submit(hash_and_store, result)
+
+            finished = Future()
+
+            def resolve(future):
+                if future.exception():
+                    finished.set_exception(future.exception())
+                else:
+                    finished.set_result(future.result())
+
+            def transcoded(future):
+                if future.exception() or future.result()['status'] != 'downloaded':
+                    resolve(future)
+                else:
+                    hasher.submit(hash_and_store, future.result()).add_done_callback(resolve)
+
+            transcoder.submit(self._transcode_result, result, audio_mode).add_done_callback(transcoded)
+            return finished
+
+        return finish
+
+    def _store_result(self, result, store):
+        """Moves a hashed download into the content store, leaving a link at its path; runs on a hashing thread."""
+        if result['status'] != 'downloaded':
+            return result
+        try:
+            result['store_path'] = store.ingest(result['path'], result['file_hash'])
+        except OSError as e:
+            print(f"Could not add {result['path']} to the content store: {str(e)}")
+        return result
+
+    def create_content_store(self, output_path, enabled=None):
+        """Returns the content store under output_path, or None when the store is disabled."""
+        enabled = self.content_store if enabled is None else enabled
+        return ContentStore.under(output_path) if enabled else None
+
+    def create_scheduler(self, workers=None, downloads_per_hour=None, burst=1, adaptive=None, throttle_state=None):
+        """
+        Returns a scheduler paced at downloads_per_hour, or, with adaptive pacing, one whose rate
+        and concurrency are learned by an AdaptiveThrottle, starting from throttle_state (the
+        state saved by an earlier run) or else from downloads_per_hour on a single worker.
+        The throttle never runs more than `workers` downloads at once.
+        """
+        workers = workers or self.download_workers
+        downloads_per_hour = downloads_per_hour or self.downloads_per_hour
+        throttle = None
+        if self.adaptive_pacing if adaptive is None else adaptive:
+            throttle = AdaptiveThrottle(
+                downloads_per_hour=(throttle_state or {}).get('downloads_per_hour') or downloads_per_hour or DEFAULT_DOWNLOADS_PER_HOUR,
+                concurrency=(throttle_state or {}).get('concurrency') or 1,
+                max_concurrency=workers,
+                max_rate=self.max_downloads_per_hour
+            )
+        return DownloadScheduler(
+            workers=workers,
+            downloads_per_hour=downloads_per_hour,
+            burst=burst,
+            throttle=throttle
+        )
+
+    def download_many(self, video_ids, output_path, audio_only=False, scheduler=None, on_tick=None, total=None, content_store=None, audio_mode=None):
+        """
+        Downloads videos on the scheduler's worker pool; each worker reuses one YoutubeDL for the run.
+        Finished files are transcoded (in pipelined mode) and hashed on separate pools, so workers
+        go straight to their next download, and then moved into content_store, when given.
+        video_ids may be a lazy iterable (pass total), which is advanced on the calling thread.
+        Yields per-video result dicts on the calling thread as they complete; the
+        caller records them, since the database connection belongs to its thread.
+        """
+        scheduler = scheduler or self.create_scheduler()
+        jobs = ({'video_id': video_id} for video_id in video_ids)
+        if total is None:
+            jobs = list(jobs)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.hash_workers) as hasher, \
+                    self._transcode_pool(audio_only) as transcoder:
+                yield from scheduler.run(
+                    jobs,
+                    lambda job: self.download_video_id(job['video_id'], output_path, audio_only, audio_mode),
+                    on_tick=on_tick,
+                    total=total,
+                    finish=self._finisher(hasher, transcoder, content_store, audio_mode)
+                )
+        finally:
+            self._close_thread_ydls()
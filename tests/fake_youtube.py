@@ -0,0 +1,136 @@
+"""In-memory stand-ins for the YouTube API client, so the services are tested without network."""
+from contextlib import contextmanager
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from services.youtube_api_service import YouTubeAPIService
+
+
+def http_error(status, reason=''):
+    return HttpError(httplib2.Response({'status': status}), f'{{"error": {{"errors": [{{"reason": "{reason}"}}]}}}}'.encode())
+
+
+def video_resource(video_id, title=None, views=0):
+    return {
+        'id': video_id,
+        'snippet': {
+            'title': title or f'Video {video_id}', 'description': '', 'publishedAt': '2024-01-01T00:00:00Z',
+            'channelId': 'UC1', 'channelTitle': 'Channel',
+        },
+        'statistics': {'viewCount': str(views)},
+        'contentDetails': {'duration': 'PT3M'},
+    }
+
+
+def playlist_item_resource(video_id, position, title=None, privacy='public'):
+    return {
+        'id': f'item-{video_id}',
+        'snippet': {'position': position, 'title': title or f'Video {video_id}'},
+        'contentDetails': {'videoId': video_id},
+        'status': {'privacyStatus': privacy},
+    }
+
+
+class FakeTransport:
+    max_connections = 4
+
+    @contextmanager
+    def connection(self, credentials):
+        yield None
+
+
+class FakeRequest:
+    def __init__(self, name, method_id='youtube.videos.list', answer=None):
+        self.name = name
+        self.methodId = method_id
+        self.method = 'GET'
+        self.headers = {}
+        self.uri = f'https://youtube.test/{name}'
+        self.postproc = lambda resp, content: content
+        self.answer = answer
+
+    def execute(self, http=None):
+        outcome = self.answer(self)
+        if isinstance(outcome, HttpError):
+            raise outcome
+        return self.postproc({'etag': outcome.get('etag')}, outcome)
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request, request_id))
+
+    def execute(self, http=None):
+        self.service.batches.append([request.name for request, _ in self.requests])
+        if self.service.batch_errors:
+            raise self.service.batch_errors.pop(0)
+        for request, request_id in self.requests:
+            outcome = self.service.answer(request)
+            if isinstance(outcome, HttpError):
+                self.callback(request_id, None, outcome)
+            else:
+                self.callback(request_id, outcome, None)
+
+
+class FakeResource:
+    def __init__(self, youtube, name):
+        self.youtube = youtube
+        self.name = name
+
+    def list(self, **params):
+        self.youtube.calls.append((self.name, params))
+        return FakeRequest(params, f'youtube.{self.name}.list', self.youtube.answer)
+
+
+class FakeYouTube:
+    """
+    Answers requests with answer(request): a response dict or an HttpError.
+    Resource requests carry their list() parameters as request.name.
+    """
+
+    def __init__(self, answer, batch_errors=()):
+        self.answer = answer
+        self.batch_errors = list(batch_errors)
+        self.batches = []
+        self.calls = []
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def playlistItems(self):
+        return FakeResource(self, 'playlistItems')
+
+    def videos(self):
+        return FakeResource(self, 'videos')
+
+
+class FakePlaylists:
+    """Serves playlistItems.list pages and videos.list lookups for a set of playlists."""
+
+    def __init__(self, playlists, videos, page_size=50):
+        self.playlists = playlists  # {playlist_id: [playlist item resources]}
+        self.videos = videos  # {video_id: video resource}
+        self.page_size = page_size
+
+    def __call__(self, request):
+        params = request.name
+        if 'playlistId' in params:
+            items = self.playlists[params['playlistId']]
+            start = int(params.get('pageToken') or 0)
+            page = {'items': items[start:start + self.page_size]}
+            if start + self.page_size < len(items):
+                page['nextPageToken'] = str(start + self.page_size)
+            return page
+        return {'items': [self.videos[video_id] for video_id in params['id'].split(',') if video_id in self.videos]}
+
+
+def make_service(youtube, **kwargs):
+    service = YouTubeAPIService('client_secrets.json', transport=FakeTransport(), **kwargs)
+    service.youtube = youtube
+    return service
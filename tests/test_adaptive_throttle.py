@@ -0,0 +1,71 @@
+from agents.commands import starting_throttle_state
+from database.database import Database
+from services.adaptive_throttle import AdaptiveThrottle, is_throttling_error
+from services.download_scheduler import DownloadScheduler
+from services.yt_dlp_service import YTDLPService
+
+
+def test_throttling_errors_are_recognised():
+    assert is_throttling_error('ERROR: unable to download video data: HTTP Error 429: Too Many Requests')
+    assert is_throttling_error("Sign in to confirm you're not a bot")
+    assert not is_throttling_error('Video unavailable')
+    assert not is_throttling_error(None)
+
+
+def test_successes_raise_rate_and_concurrency():
+    throttle = AdaptiveThrottle(downloads_per_hour=60, concurrency=1, max_concurrency=2, increase=6, concurrency_step=2)
+    for _ in range(4):
+        throttle.record({'status': 'downloaded'})
+
+    assert throttle.downloads_per_hour == 84
+    assert throttle.concurrency == 2
+
+
+def test_rate_stays_within_limits():
+    throttle = AdaptiveThrottle(downloads_per_hour=100, min_rate=10, max_rate=110, increase=6, cooldown=0)
+    for _ in range(5):
+        throttle.record_success()
+    assert throttle.downloads_per_hour == 110
+    for _ in range(10):
+        throttle.record_throttle()
+    assert throttle.downloads_per_hour == 10
+
+
+def test_throttle_halves_and_cooldown_absorbs_the_burst():
+    throttle = AdaptiveThrottle(downloads_per_hour=80, concurrency=4, max_concurrency=4, cooldown=60)
+    throttle.record({'status': 'download_error', 'throttled': True})
+    throttle.record({'status': 'download_error', 'throttled': True})
+
+    assert (throttle.downloads_per_hour, throttle.concurrency) == (40, 2)
+    assert (throttle.throttle_events, throttle.cuts) == (2, 1)
+
+
+def test_other_failures_leave_the_pacing_alone():
+    throttle = AdaptiveThrottle(downloads_per_hour=60, concurrency=2, max_concurrency=2)
+    throttle.record({'status': 'download_error', 'throttled': False})
+    assert (throttle.downloads_per_hour, throttle.concurrency, throttle.cuts) == (60, 2, 0)
+
+
+def test_scheduler_follows_the_throttle():
+    throttle = AdaptiveThrottle(downloads_per_hour=3600, concurrency=2, max_concurrency=2, max_rate=36000)
+    scheduler = DownloadScheduler(workers=2, burst=10, throttle=throttle)
+    jobs = [{'video_id': 'v0'}]
+
+    list(scheduler.run(jobs, lambda job: {'video_id': 'v0', 'status': 'download_error', 'throttled': True}))
+    assert scheduler.downloads_per_hour == 1800
+    assert scheduler.pacer.rate == 0.5
+    assert throttle.concurrency == 1
+
+
+def test_command_line_pacing_wins_over_the_saved_state(tmp_path):
+    db = Database(str(tmp_path / 'playlists.db'))
+    db.save_throttle_state({'downloads_per_hour': 12.0, 'concurrency': 1})
+    service = YTDLPService(download_workers=2)
+
+    throttle = service.create_scheduler(
+        workers=4, downloads_per_hour=90, adaptive=True, throttle_state=starting_throttle_state(db, 4, 90)
+    ).throttle
+    assert (throttle.downloads_per_hour, throttle.concurrency, throttle.max_concurrency) == (90, 4, 4)
+
+    throttle = service.create_scheduler(adaptive=True, throttle_state=starting_throttle_state(db)).throttle
+    assert (throttle.downloads_per_hour, throttle.concurrency, throttle.max_concurrency) == (12.0, 1, 2)
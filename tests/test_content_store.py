@@ -0,0 +1,99 @@
+import os
+
+from agents.commands import find_stored_downloads, link_stored_downloads, place_in_folders
+from database.database import Database
+from services.content_store import ContentStore, link_file
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_ingest_moves_the_file_into_the_store_and_links_it_back(tmp_path):
+    store = ContentStore.under(str(tmp_path))
+    path = str(tmp_path / 'Playlist' / 'a.mp3')
+    write(path, 'audio')
+
+    stored = store.ingest(path, 'aa11')
+    assert stored == os.path.join(str(tmp_path), '.stash-store', 'aa', 'aa11.mp3')
+    assert os.path.samefile(path, stored)
+    assert store.find('aa11') == stored
+    assert store.find('bb22') is None
+
+
+def test_ingesting_identical_content_keeps_one_stored_copy(tmp_path):
+    store = ContentStore.under(str(tmp_path))
+    first, second = str(tmp_path / 'First' / 'a.mp3'), str(tmp_path / 'Second' / 'b.mp3')
+    write(first, 'audio')
+    write(second, 'audio')
+
+    assert store.ingest(first, 'aa11') == store.ingest(second, 'aa11')
+    assert os.path.samefile(first, second)
+    assert os.listdir(os.path.join(store.root, 'aa')) == ['aa11.mp3']
+
+
+def test_rerun_into_the_same_folder_links_and_records_nothing(tmp_path):
+    db = Database(str(tmp_path / 'playlists.db'))
+    store = ContentStore.under(str(tmp_path))
+    folder = str(tmp_path / 'Playlist')
+    path = os.path.join(folder, 'a.mp3')
+    write(path, 'audio')
+    store.ingest(path, 'aa11')
+    db.add_downloads([('a', path, 'aa11', None)])
+
+    assert find_stored_downloads(db, store, ['a'], folder) == {}
+    assert len(db.get_downloads_for_video('a')) == 1
+
+
+def test_stored_download_is_linked_into_a_new_folder_once(tmp_path):
+    db = Database(str(tmp_path / 'playlists.db'))
+    store = ContentStore.under(str(tmp_path))
+    path = str(tmp_path / 'First' / 'a.mp3')
+    write(path, 'audio')
+    store.ingest(path, 'aa11')
+    db.add_downloads([('a', path, 'aa11', None)])
+
+    second = str(tmp_path / 'Second')
+    stored_downloads = find_stored_downloads(db, store, ['a'], second)
+    assert stored_downloads['a']['dest'] == os.path.join(second, 'a.mp3')
+    assert link_stored_downloads(db, store, stored_downloads) == 1
+    assert os.path.samefile(os.path.join(second, 'a.mp3'), path)
+    # Linking the same plan again finds the file in place and records nothing new
+    assert link_stored_downloads(db, store, stored_downloads) == 0
+    assert len(db.get_downloads_for_video('a')) == 2
+
+
+def test_place_in_folders_replaces_a_file_left_by_a_crashed_run(tmp_path):
+    first, second = str(tmp_path / 'First'), str(tmp_path / 'Second')
+    write(os.path.join(first, 'a.mp3'), 'partial')
+    fresh = str(tmp_path / 'a.mp3')
+    write(fresh, 'audio')
+
+    paths = place_in_folders(fresh, [first, second])
+    assert not os.path.exists(fresh)
+    with open(paths[0]) as f:
+        assert f.read() == 'audio'
+    assert os.path.samefile(paths[0], paths[1])
+
+
+def test_link_file_hardlinks_and_leaves_an_existing_file_alone(tmp_path):
+    source, dest = str(tmp_path / 'a.mp3'), str(tmp_path / 'Other' / 'a.mp3')
+    write(source, 'audio')
+
+    assert link_file(source, dest) == 'hardlink'
+    assert os.path.samefile(source, dest)
+    assert link_file(str(tmp_path / 'missing.mp3'), dest) == 'existing'
+
+
+def test_link_file_falls_back_to_a_symlink(tmp_path, monkeypatch):
+    source, dest = str(tmp_path / 'a.mp3'), str(tmp_path / 'Other' / 'a.mp3')
+    write(source, 'audio')
+
+    def cross_device(src, dst):
+        raise OSError('Invalid cross-device link')
+
+    monkeypatch.setattr('services.content_store.os.link', cross_device)
+    assert link_file(source, dest) == 'symlink'
+    assert os.path.islink(dest) and os.path.samefile(source, dest)
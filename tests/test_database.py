@@ -0,0 +1,205 @@
+from datetime import datetime
+import sqlite3
+
+import pytest
+
+from database.database import MAX_DOWNLOAD_ATTEMPTS, SCHEMA_MIGRATIONS, Database
+
+
+def open_database(tmp_path):
+    return Database(str(tmp_path / 'playlists.db'))
+
+
+def video(video_id, title='Title', views=0):
+    return {
+        'id': video_id, 'title': title, 'description': '', 'published_at': datetime(2024, 1, 1),
+        'channel_id': 'UC1', 'channel_title': 'Channel', 'view_count': views, 'like_count': 0,
+        'comment_count': 0, 'duration': 'PT3M'
+    }
+
+
+def queue_statuses(db, job_id):
+    db.cursor.execute('SELECT video_id, status, attempts FROM download_queue WHERE job_id = ? ORDER BY id', (job_id,))
+    return db.cursor.fetchall()
+
+
+def test_new_database_is_migrated_to_the_latest_version(tmp_path):
+    db = open_database(tmp_path)
+    assert db.get_schema_version() == len(SCHEMA_MIGRATIONS)
+    db.cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    tables = {row[0] for row in db.cursor.fetchall()}
+    assert {'playlists', 'videos', 'downloads', 'download_jobs', 'download_queue', 'throttle_state'} <= tables
+
+
+def test_reopening_applies_no_migration_twice(tmp_path):
+    open_database(tmp_path).conn.close()
+    db = open_database(tmp_path)
+    db.cursor.execute('SELECT version FROM schema_version ORDER BY version')
+    assert [row[0] for row in db.cursor.fetchall()] == list(range(1, len(SCHEMA_MIGRATIONS) + 1))
+
+
+def test_unversioned_database_keeps_its_rows(tmp_path):
+    # A database created before schema versioning: the baseline tables without schema_version
+    conn = sqlite3.connect(str(tmp_path / 'playlists.db'))
+    for statement in SCHEMA_MIGRATIONS[0]:
+        conn.execute(statement)
+    conn.execute("INSERT INTO downloads (video_id, file_path, file_hash) VALUES ('v1', '/music/v1.mp3', 'md5')")
+    conn.commit()
+    conn.close()
+
+    db = open_database(tmp_path)
+    assert db.get_schema_version() == len(SCHEMA_MIGRATIONS)
+    db.cursor.execute('SELECT video_id, file_path, file_hash, file_blake2b FROM downloads')
+    assert db.cursor.fetchall() == [('v1', '/music/v1.mp3', 'md5', None)]
+
+
+def test_failed_migration_is_rolled_back(tmp_path, monkeypatch):
+    broken = SCHEMA_MIGRATIONS + [['CREATE TABLE extra (id INTEGER)', 'NOT VALID SQL']]
+    monkeypatch.setattr('database.database.SCHEMA_MIGRATIONS', broken)
+    with pytest.raises(sqlite3.Error):
+        open_database(tmp_path)
+
+    monkeypatch.setattr('database.database.SCHEMA_MIGRATIONS', SCHEMA_MIGRATIONS)
+    db = open_database(tmp_path)
+    assert db.get_schema_version() == len(SCHEMA_MIGRATIONS)
+    db.cursor.execute("SELECT name FROM sqlite_master WHERE name = 'extra'")
+    assert db.cursor.fetchone() is None
+
+
+def test_download_queue_claims_items_in_order(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a', 'b', 'a'], downloads_per_hour=9, burst=3)
+
+    assert db.get_download_queue_counts(job_id) == {'pending': 2, 'in_progress': 0, 'done': 0, 'failed': 0}
+    assert db.claim_download_item(job_id) == 'a'
+    assert db.claim_download_item(job_id) == 'b'
+    assert db.claim_download_item(job_id) is None
+    assert queue_statuses(db, job_id) == [('a', 'in_progress', 1), ('b', 'in_progress', 1)]
+
+
+def test_finished_item_records_its_download(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a'])
+    db.claim_download_item(job_id)
+    db.finish_download_item(job_id, 'a', 'done', file_path='/music/a.mp3', file_hash='md5', file_blake2b='b2', cpu_seconds=1.5)
+
+    assert db.get_download_queue_counts(job_id)['done'] == 1
+    assert db.get_downloads_for_video('a')
+    assert db.finish_download_job(job_id)
+    assert db.get_download_job(job_id)['status'] == 'completed'
+    assert db.get_latest_active_download_job() is None
+
+
+def test_reset_requeues_interrupted_and_retryable_items(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a', 'b', 'c'])
+    for _ in range(3):
+        db.claim_download_item(job_id)
+    db.finish_download_item(job_id, 'a', 'done', file_path='/music/a.mp3', file_hash='md5')
+    db.finish_download_item(job_id, 'b', 'failed', error='HTTP Error 429')
+    # 'c' is left in progress, as by a run that was interrupted
+    db.cursor.execute("UPDATE download_queue SET claimed_by = 'gone-host:1' WHERE video_id = 'c'")
+    db.conn.commit()
+
+    assert db.reset_download_queue(job_id) == 2
+    assert queue_statuses(db, job_id) == [('a', 'done', 1), ('b', 'pending', 1), ('c', 'pending', 1)]
+
+
+def test_reset_leaves_live_claims_alone(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a'])
+    db.claim_download_item(job_id)  # claimed by this process, which is still running
+
+    assert db.reset_download_queue(job_id) == 0
+    assert queue_statuses(db, job_id) == [('a', 'in_progress', 1)]
+
+
+def test_claim_marks_already_downloaded_videos_done(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a', 'b'])
+    db.add_downloads([('a', '/music/a.mp3', 'md5', None)])
+
+    assert db.claim_download_item(job_id) == 'b'
+    assert queue_statuses(db, job_id) == [('a', 'done', 1), ('b', 'in_progress', 1)]
+
+
+def test_rerun_takes_over_the_active_job_of_the_playlist(tmp_path):
+    db = open_database(tmp_path)
+    first = db.create_download_job('PL1', '/music', True, ['a', 'b'], downloads_per_hour=9)
+    other = db.create_download_job('PL2', '/music', True, ['c'])
+    second = db.create_download_job('PL1', '/other', True, ['b', 'd'], downloads_per_hour=20)
+
+    assert second == first != other
+    assert db.get_download_job(first)['output_path'] == '/other'
+    assert db.get_download_job(first)['downloads_per_hour'] == 20
+    assert db.get_download_queue_video_ids(first, 'pending') == ['a', 'b', 'd']
+    assert db.create_download_job(None, '/music', True, ['a']) not in (first, other)
+
+
+def test_item_out_of_attempts_stays_failed(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a'])
+    for _ in range(MAX_DOWNLOAD_ATTEMPTS):
+        db.reset_download_queue(job_id)
+        assert db.claim_download_item(job_id) == 'a'
+        db.finish_download_item(job_id, 'a', 'failed', error='unavailable')
+
+    assert db.reset_download_queue(job_id) == 0
+    assert db.claim_download_item(job_id) is None
+
+
+def test_job_with_retryable_failures_stays_active(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a', 'b'])
+    db.claim_download_item(job_id)
+    db.claim_download_item(job_id)
+    db.finish_download_item(job_id, 'a', 'done', file_path='/music/a.mp3', file_hash='md5')
+    db.finish_download_item(job_id, 'b', 'failed', error='HTTP Error 429')
+
+    assert not db.finish_download_job(job_id)
+    assert db.get_latest_active_download_job()['id'] == job_id
+
+    db.cursor.execute('UPDATE download_queue SET attempts = ? WHERE video_id = ?', (MAX_DOWNLOAD_ATTEMPTS, 'b'))
+    db.conn.commit()
+    assert db.finish_download_job(job_id)
+    assert db.get_latest_active_download_job() is None
+
+
+def test_job_with_pending_items_is_not_completed(tmp_path):
+    db = open_database(tmp_path)
+    job_id = db.create_download_job('PL1', '/music', True, ['a', 'b'])
+    db.claim_download_item(job_id)
+    db.finish_download_item(job_id, 'a', 'done', file_path='/music/a.mp3', file_hash='md5')
+
+    assert not db.finish_download_job(job_id)
+    assert db.get_download_job(job_id)['status'] == 'active'
+
+
+def test_throttle_state_round_trips(tmp_path):
+    db = open_database(tmp_path)
+    assert db.get_throttle_state() is None
+    db.save_throttle_state({'downloads_per_hour': 30.0, 'concurrency': 2})
+    db.save_throttle_state({'downloads_per_hour': 15.0, 'concurrency': 1})
+    state = db.get_throttle_state()
+    assert (state['downloads_per_hour'], state['concurrency']) == (15.0, 1)
+
+
+def test_upsert_classifies_inserted_updated_and_unchanged_videos(tmp_path):
+    db = open_database(tmp_path)
+    first = db.upsert_videos('PL1', [video('a'), video('b'), video('c')])
+    assert (first['inserted'], first['updated'], first['unchanged']) == (['a', 'b', 'c'], [], [])
+
+    # View counts are not part of the content hash
+    second = db.upsert_videos('PL1', [video('a', title='Renamed'), video('b', views=99), video('c'), video('d')])
+    assert (second['inserted'], second['updated'], second['unchanged']) == (['d'], ['a'], ['b', 'c'])
+    db.cursor.execute("SELECT title, view_count FROM videos WHERE id IN ('a', 'b') ORDER BY id")
+    assert db.cursor.fetchall() == [('Renamed', 0), ('Title', 0)]
+
+
+def test_upsert_keeps_the_download_state_of_changed_videos(tmp_path):
+    db = open_database(tmp_path)
+    db.upsert_videos('PL1', [video('a')])
+    db.update_video_download_status('a', True, 'md5')
+
+    assert db.upsert_videos('PL1', [video('a', title='Renamed')])['updated'] == ['a']
+    assert db.get_video_download_status('a') == (1, 'md5')
@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from services.download_scheduler import DownloadScheduler
+
+
+def make_jobs(count):
+    return [{'video_id': f'v{i}'} for i in range(count)]
+
+
+def downloaded(job, size=1024):
+    return {'video_id': job['video_id'], 'status': 'downloaded', 'bytes': size}
+
+
+def test_run_yields_every_result_and_tracks_progress():
+    scheduler = DownloadScheduler(workers=3)
+    results = list(scheduler.run(make_jobs(5), downloaded))
+
+    assert sorted(result['video_id'] for result in results) == [f'v{i}' for i in range(5)]
+    progress = scheduler.progress()
+    assert (progress['total'], progress['completed'], progress['failed']) == (5, 5, 0)
+    assert progress['eta'] is None
+
+
+def test_failures_are_counted_separately():
+    scheduler = DownloadScheduler(workers=2)
+
+    def download(job):
+        status = 'download_error' if job['video_id'] == 'v1' else 'downloaded'
+        return {'video_id': job['video_id'], 'status': status}
+
+    list(scheduler.run(make_jobs(3), download))
+    assert (scheduler.completed, scheduler.failed) == (2, 1)
+
+
+def test_concurrency_is_capped_at_workers():
+    scheduler = DownloadScheduler(workers=3)
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def download(job):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        return downloaded(job)
+
+    list(scheduler.run(make_jobs(9), download))
+    assert peak == 3
+
+
+def test_starts_are_paced_after_the_burst():
+    # 36000 downloads/hour is one every 0.1 s once the burst of 2 is spent
+    scheduler = DownloadScheduler(workers=4, downloads_per_hour=36000, burst=2)
+    started = time.monotonic()
+    list(scheduler.run(make_jobs(4), downloaded))
+    assert time.monotonic() - started >= 0.18
+
+
+def test_lazy_jobs_are_drawn_only_as_workers_free_up():
+    scheduler = DownloadScheduler(workers=2)
+    drawn = []
+    in_flight_when_drawn = []
+    running = []
+
+    def jobs():
+        for job in make_jobs(5):
+            in_flight_when_drawn.append(len(running))
+            drawn.append(job['video_id'])
+            yield job
+
+    def download(job):
+        running.append(job['video_id'])
+        time.sleep(0.01)
+        running.remove(job['video_id'])
+        return downloaded(job)
+
+    results = list(scheduler.run(jobs(), download, total=5))
+    assert len(results) == 5
+    assert drawn == [f'v{i}' for i in range(5)]
+    assert max(in_flight_when_drawn) < 2
+    assert scheduler.progress()['total'] == 5
+
+
+def test_finish_future_result_is_yielded_in_place_of_the_download():
+    scheduler = DownloadScheduler(workers=2)
+    with ThreadPoolExecutor(max_workers=1) as hasher:
+        def finish(result):
+            if result['status'] != 'downloaded':
+                return None
+            return hasher.submit(lambda: {**result, 'file_hash': f"hash-{result['video_id']}"})
+
+        results = list(scheduler.run(make_jobs(3), downloaded, finish=finish))
+
+    assert sorted(result['file_hash'] for result in results) == ['hash-v0', 'hash-v1', 'hash-v2']
+    assert scheduler.completed == 3
+
+
+def test_on_tick_is_called_while_waiting():
+    scheduler = DownloadScheduler(workers=1)
+    ticks = []
+
+    def download(job):
+        time.sleep(0.05)
+        return downloaded(job)
+
+    list(scheduler.run(make_jobs(2), download, on_tick=lambda: ticks.append(1), tick_interval=0.01))
+    assert ticks
+
+
+
+def test_closing_the_run_releases_workers_waiting_on_the_pacer():
+    # One download an hour: after the first, every worker waits on the pacer
+    scheduler = DownloadScheduler(workers=3, downloads_per_hour=1, burst=1)
+    started = []
+
+    def download(job):
+        started.append(job['video_id'])
+        return downloaded(job)
+
+    results = scheduler.run(make_jobs(5), download)
+    assert next(results)['video_id'] == 'v0'
+    closed_at = time.monotonic()
+    results.close()
+
+    assert time.monotonic() - closed_at < 1
+    assert started == ['v0']
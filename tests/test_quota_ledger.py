@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.quota_ledger import QuotaExceededError, QuotaLedger
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freezes the ledger's clock at 23:00 Pacific (07:00 UTC next day); sleeping advances it."""
+    class FrozenDatetime(datetime):
+        current = datetime(2026, 3, 2, 7, 0, tzinfo=timezone.utc)
+
+        @classmethod
+        def now(cls, tz=None):
+            return cls.current.astimezone(tz)
+
+    def sleep(seconds):
+        FrozenDatetime.current += timedelta(seconds=seconds)
+
+    monkeypatch.setattr('services.quota_ledger.datetime', FrozenDatetime)
+    monkeypatch.setattr('services.quota_ledger.time.sleep', sleep)
+    return FrozenDatetime
+
+
+def test_reservations_beyond_the_daily_limit_are_refused(tmp_path, clock):
+    ledger = QuotaLedger(str(tmp_path / 'quota.db'), daily_limit=10)
+    assert ledger.reserve(8, 'videos.list') == 8
+    with pytest.raises(QuotaExceededError):
+        ledger.reserve(3, 'search.list')
+    assert ledger.reserve(2, 'videos.list') == 10
+    assert ledger.usage_by_command() == [{'command': 'videos.list', 'units': 10, 'calls': 2}]
+
+
+def test_quota_day_rolls_over_at_pacific_midnight(tmp_path, clock):
+    ledger = QuotaLedger(str(tmp_path / 'quota.db'), daily_limit=10)
+    ledger.reserve(10, 'videos.list')
+    assert ledger.used() == 10 and ledger.used('2026-03-01') == 10
+
+    clock.current += timedelta(minutes=59)  # 23:59 Pacific, still the same quota day
+    with pytest.raises(QuotaExceededError):
+        ledger.reserve(1, 'videos.list')
+
+    clock.current += timedelta(minutes=1)  # midnight Pacific, 08:00 UTC
+    assert ledger.reserve(1, 'videos.list') == 1
+    assert ledger.used('2026-03-02') == 1
+
+
+def test_deferred_reservation_waits_for_the_reset(tmp_path, clock):
+    ledger = QuotaLedger(str(tmp_path / 'quota.db'), daily_limit=10, policy='defer')
+    ledger.reserve(10, 'videos.list')
+
+    assert ledger.reserve(1, 'videos.list') == 1
+    assert clock.current == datetime(2026, 3, 2, 8, 0, 1, tzinfo=timezone.utc)
+    assert ledger.used('2026-03-01') == 10 and ledger.used('2026-03-02') == 1
+
+
+def test_mark_exhausted_spends_the_rest_of_the_day(tmp_path, clock):
+    ledger = QuotaLedger(str(tmp_path / 'quota.db'), daily_limit=10)
+    ledger.reserve(4, 'videos.list')
+    ledger.mark_exhausted()
+    assert ledger.used() == 10
+    with pytest.raises(QuotaExceededError):
+        ledger.reserve(1, 'videos.list')
@@ -0,0 +1,48 @@
+import itertools
+
+from services.response_cache import ResponseCache
+from tests.fake_youtube import FakeRequest, FakeYouTube, http_error, make_service
+
+
+def test_not_modified_response_is_answered_from_the_cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'))
+    sent = []
+
+    def answer(request):
+        sent.append(dict(request.headers))
+        if request.headers.get('If-None-Match') == 'etag-1':
+            return http_error(304)
+        return {'etag': 'etag-1', 'items': ['a']}
+
+    service = make_service(FakeYouTube(answer), response_cache=cache)
+    assert service._execute_request(FakeRequest('videos', answer=answer)) == {'etag': 'etag-1', 'items': ['a']}
+    assert service._execute_request(FakeRequest('videos', answer=answer)) == {'etag': 'etag-1', 'items': ['a']}
+
+    assert sent == [{}, {'If-None-Match': 'etag-1'}]
+    assert (cache.stats()['hits'], cache.stats()['misses']) == (1, 1)
+
+
+def test_changed_response_replaces_the_cached_one(tmp_path):
+    cache = ResponseCache(str(tmp_path / 'cache.db'))
+    responses = iter([{'etag': 'etag-1', 'items': ['a']}, {'etag': 'etag-2', 'items': ['a', 'b']}])
+    service = make_service(FakeYouTube(None), response_cache=cache)
+
+    for _ in range(2):
+        service._execute_request(FakeRequest('videos', answer=lambda request: next(responses)))
+    assert cache.get(ResponseCache.make_key(FakeRequest('videos'))) == {'etag': 'etag-2', 'response': {'etag': 'etag-2', 'items': ['a', 'b']}}
+
+
+def test_least_recently_used_entries_are_evicted_beyond_max_bytes(tmp_path, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr('services.response_cache.time.time', lambda: next(clock))
+    body = {'items': ['x' * 100]}
+    cache = ResponseCache(str(tmp_path / 'cache.db'), max_bytes=300)
+
+    cache.put('a', 'etag-a', body)
+    cache.put('b', 'etag-b', body)
+    cache.get('a')  # 'b' is now the least recently used
+    cache.put('c', 'etag-c', body)
+
+    assert cache.get('b') is None
+    assert cache.get('a') and cache.get('c')
+    assert cache.stats()['entries'] == 2
@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from database.database import Database
+from services.sync_engine import AsyncSyncEngine
+from tests.fake_youtube import FakePlaylists, FakeYouTube, http_error, make_service, playlist_item_resource, video_resource
+
+
+def fake_playlists(playlist_ids, size=6):
+    playlists = {
+        playlist_id: [playlist_item_resource(f'{playlist_id}-v{i}', i) for i in range(size)]
+        for playlist_id in playlist_ids
+    }
+    videos = {item['contentDetails']['videoId']: video_resource(item['contentDetails']['videoId'])
+              for items in playlists.values() for item in items}
+    return FakePlaylists(playlists, videos, page_size=2)
+
+
+def test_pages_keep_playlist_order_when_later_pages_resolve_first():
+    playlists = fake_playlists(['PL1'])
+
+    def answer(request):
+        if request.name.get('id', '').startswith('PL1-v0'):
+            time.sleep(0.05)  # the first page's videos resolve last
+        return playlists(request)
+
+    engine = AsyncSyncEngine(make_service(FakeYouTube(answer)))
+    fetched = engine.run(engine.fetch_playlist_items('PL1'))
+    assert [video['id'] for video in fetched['videos']] == [f'PL1-v{i}' for i in range(6)]
+    assert [item['position'] for item in fetched['items']] == list(range(6))
+
+
+def test_failed_page_fetch_is_raised():
+    playlists = fake_playlists(['PL1'])
+
+    def answer(request):
+        if request.name.get('pageToken') == '4':
+            return http_error(404, 'playlistNotFound')
+        return playlists(request)
+
+    engine = AsyncSyncEngine(make_service(FakeYouTube(answer)))
+    with pytest.raises(HttpError):
+        engine.run(engine.fetch_playlist_items('PL1'))
+
+
+def test_sync_reports_a_failed_playlist_and_stores_the_others(tmp_path):
+    db = Database(str(tmp_path / 'playlists.db'))
+    playlists = fake_playlists(['PL1', 'PL2', 'PL3'])
+
+    def answer(request):
+        if request.name.get('playlistId') == 'PL2':
+            return http_error(404, 'playlistNotFound')
+        return playlists(request)
+
+    service = make_service(FakeYouTube(answer))
+    results = {result['playlist_id']: result for result in service.sync_playlists(db, ['PL1', 'PL2', 'PL3'], workers=2)}
+
+    assert results['PL2']['error'].resp.status == 404
+    assert len(results['PL1']['videos']) == len(results['PL3']['videos']) == 6
+    assert sorted(db.get_playlist_items('PL3').values()) == [(f'PL3-v{i}', i) for i in range(6)]
+
+
+def test_sync_stops_when_the_quota_is_exceeded(tmp_path):
+    db = Database(str(tmp_path / 'playlists.db'))
+    playlists = fake_playlists(['PL1', 'PL2'])
+
+    def answer(request):
+        if request.name.get('playlistId') == 'PL2':
+            return http_error(403, 'quotaExceeded')
+        return playlists(request)
+
+    service = make_service(FakeYouTube(answer))
+    with pytest.raises(HttpError):
+        list(service.sync_playlists(db, ['PL1', 'PL2'], workers=2))
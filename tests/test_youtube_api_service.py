@@ -0,0 +1,93 @@
+import pytest
+from googleapiclient.errors import HttpError
+
+from services.quota_ledger import QuotaLedger
+from tests.fake_youtube import FakePlaylists, FakeRequest, FakeYouTube, http_error, make_service, playlist_item_resource, video_resource
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr('services.youtube_api_service.time.sleep', lambda seconds: None)
+
+
+def test_quota_exceeded_batch_is_not_retried_and_exhausts_the_ledger(tmp_path):
+    ledger = QuotaLedger(str(tmp_path / 'quota.db'), daily_limit=100)
+    youtube = FakeYouTube(lambda request: {}, batch_errors=[http_error(403, 'quotaExceeded')])
+    service = make_service(youtube, quota_ledger=ledger)
+
+    with pytest.raises(HttpError):
+        service._execute_batch([FakeRequest('a'), FakeRequest('b')])
+    assert len(youtube.batches) == 1
+    assert ledger.used() == 100
+
+
+def test_batch_returns_responses_and_sub_request_errors_in_order():
+    youtube = FakeYouTube(lambda request: http_error(404, 'notFound') if request.name == 'b' else {'name': request.name})
+    service = make_service(youtube)
+
+    results = service._execute_batch([FakeRequest('a'), FakeRequest('b'), FakeRequest('c')])
+    assert results[0] == {'name': 'a'} and results[2] == {'name': 'c'}
+    assert isinstance(results[1], HttpError) and results[1].resp.status == 404
+    assert service.quota_usage == 3
+
+
+def test_only_transiently_failed_sub_requests_are_retried():
+    failures = {'b': 2}
+
+    def answer(request):
+        if failures.get(request.name):
+            failures[request.name] -= 1
+            return http_error(503)
+        return {'name': request.name}
+
+    youtube = FakeYouTube(answer)
+    results = make_service(youtube)._execute_batch([FakeRequest('a'), FakeRequest('b')])
+    assert results == [{'name': 'a'}, {'name': 'b'}]
+    assert youtube.batches == [['a', 'b'], ['b'], ['b']]
+
+
+def test_failed_batch_request_is_retried_whole():
+    youtube = FakeYouTube(lambda request: {'name': request.name}, batch_errors=[http_error(500)])
+    results = make_service(youtube)._execute_batch([FakeRequest('a'), FakeRequest('b')])
+    assert results == [{'name': 'a'}, {'name': 'b'}]
+    assert youtube.batches == [['a', 'b'], ['a', 'b']]
+
+
+def test_sub_request_out_of_retries_returns_its_error():
+    youtube = FakeYouTube(lambda request: http_error(503) if request.name == 'b' else {'name': request.name})
+    results = make_service(youtube)._execute_batch([FakeRequest('a'), FakeRequest('b')])
+    assert results[0] == {'name': 'a'}
+    assert results[1].resp.status == 503
+    assert len(youtube.batches) == 6  # the first try and MAX_RETRIES retries
+
+
+def test_requests_beyond_the_batch_limit_go_in_further_batches():
+    youtube = FakeYouTube(lambda request: {'name': request.name})
+    requests = [FakeRequest(str(i)) for i in range(51)]
+    results = make_service(youtube)._execute_batch(requests)
+    assert [result['name'] for result in results] == [str(i) for i in range(51)]
+    assert [len(batch) for batch in youtube.batches] == [50, 1]
+
+
+def test_video_details_are_fetched_50_ids_per_call_in_the_order_asked():
+    video_ids = [f'v{i:03}' for i in range(120)]
+    videos = {video_id: video_resource(video_id) for video_id in video_ids if video_id != 'v060'}
+    youtube = FakeYouTube(FakePlaylists({}, videos))
+
+    details, missing = make_service(youtube).get_videos_details(list(reversed(video_ids)) + ['v000'])
+    assert [len(params['id'].split(',')) for _, params in youtube.calls] == [50, 50, 20]
+    assert [video['id'] for video in details] == [video_id for video_id in reversed(video_ids) if video_id != 'v060'] + ['v000']
+    assert missing == ['v060']
+
+
+def test_playlist_items_are_resolved_in_playlist_order_with_missing_videos_reported():
+    items = [playlist_item_resource(f'v{i:03}', i) for i in range(60)]
+    items[3] = playlist_item_resource('v003', 3, title='Private video', privacy='private')
+    items[55] = playlist_item_resource('v055', 55, title='Deleted video')
+    videos = {f'v{i:03}': video_resource(f'v{i:03}') for i in range(60) if i not in (3, 55)}
+    youtube = FakeYouTube(FakePlaylists({'PL1': items}, videos))
+
+    fetched = make_service(youtube).fetch_playlist_items('PL1')
+    assert [video['id'] for video in fetched['videos']] == [f'v{i:03}' for i in range(60) if i not in (3, 55)]
+    assert [(video['id'], video['reason']) for video in fetched['missing']] == [('v003', 'private'), ('v055', 'deleted')]
+    assert [name for name, _ in youtube.calls].count('videos') == 2  # one per page, not one per video
@@ -0,0 +1,15 @@
+from services.yt_dlp_service import YTDLPService
+
+
+def test_audio_is_converted_in_the_download_slot_without_a_transcode_pool(monkeypatch):
+    service = YTDLPService(transcode_workers=0)
+    monkeypatch.setattr(service, '_download_result', lambda ydl, video_id, audio_only: {
+        'video_id': video_id, 'status': 'downloaded', 'path': '/music/a.webm',
+        'transcode_seconds': None, 'cpu_seconds': None, 'audio_method': None,
+    })
+    monkeypatch.setattr('services.yt_dlp_service.transcode_audio', lambda path, codec, quality: {
+        'path': '/music/a.mp3', 'seconds': 2.0, 'cpu_seconds': 1.5,
+    })
+
+    result = service._download_one(None, 'a', audio_only=True)
+    assert (result['path'], result['cpu_seconds'], result['audio_method']) == ('/music/a.mp3', 1.5, 'transcode')